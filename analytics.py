@@ -0,0 +1,84 @@
+import numpy as np
+
+# Mỗi sản phẩm chỉ chiếm 32 byte trong mảng có cấu trúc, thay vì một tuple Python với 4 đối tượng số
+PRODUCT_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("gia_nhap", np.float64),
+    ("gia_ban", np.float64),
+    ("so_luong", np.int64),
+])
+
+# count và SELECT chạy trong cùng một giao dịch đọc: máy khác thêm/xóa sản phẩm giữa hai câu lệnh thì count không
+# còn đúng với số dòng đọc được
+def load_products(database):
+    with database.read_transaction() as conn:
+        count = conn.execute("SELECT count(*) FROM sanpham").fetchone()[0]
+        cursor = conn.execute("SELECT id, coalesce(gia_nhap, 0), coalesce(gia_ban, 0), "
+                              "coalesce(so_luong, 0) FROM sanpham")
+        return np.fromiter(cursor, dtype=PRODUCT_DTYPE, count=count)
+
+def inventory_value(products):
+    return products["gia_nhap"] * products["so_luong"]
+
+# Biên lợi nhuận (%) theo giá bán; sản phẩm chưa có giá bán được tính là 0
+def margin_percent(products):
+    gia_ban = products["gia_ban"]
+    margin = np.zeros(len(products))
+    np.divide((gia_ban - products["gia_nhap"]) * 100, gia_ban, out=margin, where=gia_ban > 0)
+    return margin
+
+# Chỉ số của n phần tử lớn nhất (hoặc nhỏ nhất), đã sắp xếp; argpartition tránh sắp xếp cả mảng
+def top_n(values, n, largest=True):
+    n = min(n, len(values))
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    keys = -values if largest else values
+    indices = np.argpartition(keys, n - 1)[:n]
+    return indices[np.argsort(keys[indices], kind="stable")]
+
+def low_stock(products, threshold, n):
+    indices = np.flatnonzero(products["so_luong"] <= threshold)
+    return indices[top_n(products["so_luong"][indices], n, largest=False)]
+
+def product_names(database, ids):
+    names = {}
+    ids = [int(product_id) for product_id in ids]
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for product_id, ma_sp, ten_sp in database.query(
+                f"SELECT id, ma_sp, ten_sp FROM sanpham WHERE id IN ({placeholders})", chunk):
+            names[product_id] = (ma_sp, ten_sp)
+    return names
+
+# Kết quả cho tab "Phân tích": tổng tồn kho và các bảng xếp hạng (id, mã, tên, giá trị...)
+def inventory_report(database, n=20, low_stock_threshold=5):
+    products = load_products(database)
+    value = inventory_value(products)
+    margin = margin_percent(products)
+    revenue = products["gia_ban"] * products["so_luong"]
+
+    rankings = {
+        "value": top_n(value, n),
+        "margin": top_n(margin, n),
+        "low_stock": low_stock(products, low_stock_threshold, n),
+    }
+    ranked = np.unique(np.concatenate(list(rankings.values())))
+    names = product_names(database, products["id"][ranked])
+
+    def rows(indices):
+        return [(int(products["id"][i]), *names.get(int(products["id"][i]), ("", "")),
+                 int(products["so_luong"][i]), float(value[i]), float(margin[i])) for i in indices]
+
+    total_value = float(value.sum())
+    total_revenue = float(revenue.sum())
+    return {
+        "count": len(products),
+        "total_value": total_value,
+        "total_revenue": total_revenue,
+        "average_margin": (total_revenue - total_value) * 100 / total_revenue if total_revenue else 0.0,
+        "low_stock_count": int(np.count_nonzero(products["so_luong"] <= low_stock_threshold)),
+        "top_value": rows(rankings["value"]),
+        "top_margin": rows(rankings["margin"]),
+        "low_stock": rows(rankings["low_stock"]),
+    }
@@ -0,0 +1,277 @@
+import base64
+import json
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+
+from database import (ProductRepository, OrderRepository, ReportRepository, ChangeLog, KeysetPager,
+                      DatabaseBusyError, OutOfStockError, init_db)
+
+# bytes (ảnh) được gửi trong JSON dưới dạng {"__bytes__": base64}
+def json_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"Không thể chuyển {type(value).__name__} sang JSON")
+
+def json_object_hook(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+def dumps(value):
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data):
+    return json.loads(data, object_hook=json_object_hook)
+
+# Dòng dữ liệu đi qua JSON thành list; chuyển lại tuple như khi đọc trực tiếp từ sqlite3
+def as_rows(rows):
+    return [tuple(row) for row in rows]
+
+def as_row(row):
+    return tuple(row) if row is not None else None
+
+# Chạy trực tiếp trên file CSDL trong cùng tiến trình
+class LocalBackend:
+    remote = False
+
+    def __init__(self, database):
+        self.database = database
+        self.products = ProductRepository(database)
+        self.orders = OrderRepository(database)
+        self.reports = ReportRepository(database)
+        self.changes = ChangeLog(database)
+
+    def init(self):
+        init_db(self.database)
+
+    def inventory_report(self, n, low_stock_threshold):
+        from analytics import inventory_report
+        return inventory_report(self.database, n, low_stock_threshold)
+
+    def close(self):
+        self.database.close()
+
+# Lỗi từ máy chủ được tạo lại đúng kiểu để giao diện xử lý như khi chạy trực tiếp
+REMOTE_ERRORS = {
+    "IntegrityError": sqlite3.IntegrityError,
+    "OutOfStockError": OutOfStockError,
+    "DatabaseBusyError": DatabaseBusyError,
+    "ValueError": ValueError,
+}
+
+class ApiClient:
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    # Mỗi luồng giữ một kết nối HTTP keep-alive; http.client chỉ được nạp khi dùng máy chủ. Kết nối đang rảnh mà
+    # đọc được (máy chủ đã đóng phía bên kia) thì bỏ đi và mở kết nối mới trước khi gửi
+    def connection(self):
+        import http.client
+        import select
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    # Chỉ thử lại khi yêu cầu chưa gửi đi được; đã gửi mà mất kết nối thì máy chủ có thể đã ghi (vd. orders.insert)
+    # nên báo lỗi thay vì ghi hai lần
+    def call(self, resource, method, *args):
+        import http.client
+        body = dumps({"args": args})
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request("POST", f"/api/{resource}/{method}", body,
+                             {"Content-Type": "application/json"})
+            except (ConnectionError, http.client.HTTPException):
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+                continue
+            try:
+                response = conn.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException):
+                conn.close()
+                self.local.conn = None
+                raise
+            break
+        payload = loads(data)
+        if response.status != 200:
+            error = payload.get("error", {})
+            raise REMOTE_ERRORS.get(error.get("type"), RuntimeError)(error.get("message", f"HTTP {response.status}"))
+        return payload["result"]
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+class RemoteRepository:
+    resource = ""
+
+    def __init__(self, client):
+        self.client = client
+
+    def call(self, method, *args):
+        return self.client.call(self.resource, method, *args)
+
+# Bộ nhớ đệm trang vẫn ở phía máy khách; chỉ việc đọc một trang được gửi lên máy chủ
+class RemotePager(KeysetPager):
+    def __init__(self, client, spec, template):
+        super().__init__(client, template.table, template.columns, template.where, template.params,
+                         template.page_size, template.max_cached_pages, order_by=template.order_by,
+                         null_value=template.null_value, descending=template.descending)
+        self.spec = spec
+
+    def _fetch(self, anchor, forward):
+        rows, has_more = self.db.call("products", "page", list(self.spec), anchor, forward)
+        return as_rows(rows), has_more
+
+class RemoteProductRepository(RemoteRepository):
+    resource = "products"
+    COLUMNS = ProductRepository.COLUMNS
+    SORT_COLUMNS = ProductRepository.SORT_COLUMNS
+
+    def pager(self, page_size=200, order_by="id", descending=False, min_price=None, max_price=None):
+        spec = (page_size, order_by, descending, min_price, max_price)
+        return RemotePager(self.client, spec, ProductRepository(None).pager(*spec))
+
+    def search(self, query, limit=500):
+        return as_rows(self.call("search", query, limit))
+
+    def get(self, product_id):
+        return as_row(self.call("get", product_id))
+
+    def get_many(self, product_ids):
+        return as_rows(self.call("get_many", list(product_ids)))
+
+    def get_by_code(self, ma_sp):
+        return as_row(self.call("get_by_code", ma_sp))
+
+    def get_image_hash(self, product_id):
+        return self.call("get_image_hash", product_id)
+
+    def get_image(self, image_hash):
+        return self.call("get_image", image_hash)
+
+    def insert(self, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images=None):
+        return self.call("insert", ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images)
+
+    def update(self, product_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images=None):
+        self.call("update", product_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images)
+
+    def delete(self, product_id):
+        self.call("delete", product_id)
+
+    def delete_many(self, product_ids):
+        self.call("delete_many", list(product_ids))
+
+    def adjust_prices(self, product_ids, percent):
+        self.call("adjust_prices", list(product_ids), percent)
+
+    def adjust_quantities(self, product_ids, delta):
+        self.call("adjust_quantities", list(product_ids), delta)
+
+class RemoteOrderRepository(RemoteRepository):
+    resource = "orders"
+    COLUMNS = OrderRepository.COLUMNS
+    SORT_COLUMNS = OrderRepository.SORT_COLUMNS
+    CANCELLED = OrderRepository.CANCELLED
+    DELIVERED = OrderRepository.DELIVERED
+
+    def list(self, order_by="id", descending=False, trang_thai=None, date_from=None, date_to=None,
+             min_due=None, max_due=None):
+        return as_rows(self.call("list", order_by, descending, trang_thai, date_from, date_to, min_due, max_due))
+
+    # Máy chủ trả cả danh sách trong một lần gọi; chia đợt ở phía máy khách để dùng như OrderRepository.stream
+    def stream(self, *filters, size=1000):
+        rows = self.call("list", *filters)
+        for start in range(0, len(rows), size):
+            yield as_rows(rows[start:start + size])
+
+    def search(self, query, limit=500):
+        return as_rows(self.call("search", query, limit))
+
+    def get(self, order_id):
+        return as_row(self.call("get", order_id))
+
+    def get_many(self, order_ids):
+        return as_rows(self.call("get_many", list(order_ids)))
+
+    def get_items(self, order_id):
+        return as_rows(self.call("get_items", order_id))
+
+    def insert(self, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai, items=()):
+        return self.call("insert", ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai,
+                         list(items or ()))
+
+    def update(self, order_id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai,
+               items=None):
+        self.call("update", order_id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai,
+                  items)
+
+    def due_between(self, start_date, end_date, trang_thai):
+        return as_rows(self.call("due_between", start_date, end_date, trang_thai))
+
+    def set_status(self, order_id, trang_thai):
+        self.call("set_status", order_id, trang_thai)
+
+    def set_status_many(self, order_ids, trang_thai):
+        self.call("set_status_many", list(order_ids), trang_thai)
+
+    def delete(self, order_id):
+        self.call("delete", order_id)
+
+    def delete_many(self, order_ids):
+        self.call("delete_many", list(order_ids))
+
+class RemoteReportRepository(RemoteRepository):
+    resource = "reports"
+
+    def summary(self, group, start=None, end=None):
+        return as_rows(self.call("summary", group, start, end))
+
+    def totals(self):
+        return as_row(self.call("totals"))
+
+class RemoteChangeLog(RemoteRepository):
+    resource = "changes"
+
+    def version(self, table):
+        return self.call("version", table)
+
+    def since(self, table, version, limit=1000):
+        return as_row(self.call("since", table, version, limit))
+
+# Dùng máy chủ server.py thay cho file CSDL (đặt biến môi trường QLBH_SERVER=http://máy-chủ:8765)
+class RemoteBackend:
+    remote = True
+
+    def __init__(self, base_url):
+        self.client = ApiClient(base_url)
+        self.products = RemoteProductRepository(self.client)
+        self.orders = RemoteOrderRepository(self.client)
+        self.reports = RemoteReportRepository(self.client)
+        self.changes = RemoteChangeLog(self.client)
+
+    # Máy chủ tự khởi tạo CSDL khi chạy
+    def init(self):
+        pass
+
+    def inventory_report(self, n, low_stock_threshold):
+        return self.client.call("analytics", "inventory_report", n, low_stock_threshold)
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from PIL import Image, ImageDraw
+
+from database import Database, init_db, ImageStore
+from backend import LocalBackend
+from models import ProductRow, OrderRow
+
+HO = ("Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô")
+TEN_DEM = ("Văn", "Thị", "Minh", "Ngọc", "Thanh", "Hữu", "Đức", "Thu", "Quốc", "Anh")
+TEN = ("An", "Bình", "Chi", "Dũng", "Hà", "Hạnh", "Hùng", "Lan", "Linh", "Mai", "Nam", "Phương", "Sơn", "Trang",
+       "Tuấn", "Yến")
+LOAI_SP = ("Áo thun", "Áo sơ mi", "Quần jean", "Váy", "Túi xách", "Giày", "Mũ", "Khăn", "Cốc sứ", "Ốp điện thoại",
+           "Móc khóa", "Sổ tay", "Balo", "Đồng hồ")
+MAU = ("đỏ", "xanh", "trắng", "đen", "vàng", "hồng", "tím", "xám", "nâu", "cam")
+KIEU = ("in hình", "thêu tên", "cổ tròn", "basic", "cao cấp", "trẻ em", "đôi", "size lớn", "limited")
+DANH_MUC = ("Quần áo", "Phụ kiện", "Quà tặng", "Đồ gia dụng", "In ấn", "Giày dép")
+TRANG_THAI = (("đang đặt", 30), ("đã về", 15), ("đã giao", 50), ("đã hủy", 5))
+
+PRODUCT_QUERIES = ("áo", "ao thun", "do", "tui xach", "SP0001", "coc su trang")
+ORDER_QUERIES = ("nguyen", "tran thi", "lan", "qua tang", "phuong", "hoang minh")
+
+def product_rows(rng, count, image_hashes):
+    for i in range(1, count + 1):
+        ten_sp = f"{rng.choice(LOAI_SP)} {rng.choice(MAU)} {rng.choice(KIEU)}"
+        gia_nhap = rng.randrange(10, 2000) * 1000
+        gia_ban = round(gia_nhap * rng.uniform(1.05, 2.0), -3)
+        # Khoảng 70% sản phẩm có ảnh; ảnh được lưu theo nội dung nên nhiều sản phẩm dùng chung một ảnh
+        preview, thumbnail = rng.choice(image_hashes) if image_hashes and rng.random() < 0.7 else (None, None)
+        yield (f"SP{i:07d}", ten_sp, preview, thumbnail, gia_nhap, gia_ban, rng.randrange(0, 500))
+
+def order_rows(rng, count, start_date):
+    statuses = [status for status, _ in TRANG_THAI]
+    weights = [weight for _, weight in TRANG_THAI]
+    for i in range(count):
+        ngay_dat = start_date + timedelta(days=rng.randrange(730))
+        ngay_giao = ngay_dat + timedelta(days=rng.randrange(1, 15))
+        tong_tien = rng.randrange(50, 20000) * 1000
+        da_coc = rng.choice((0, tong_tien // 2, tong_tien, rng.randrange(0, tong_tien + 1, 1000)))
+        yield (f"{rng.choice(HO)} {rng.choice(TEN_DEM)} {rng.choice(TEN)}", rng.choice(DANH_MUC),
+               ngay_dat.isoformat(), ngay_giao.isoformat(), f"D:/don_hang/{i}.psd", tong_tien, da_coc,
+               rng.choices(statuses, weights)[0])
+
+# Ảnh gốc giả lập cỡ ảnh chụp điện thoại thu nhỏ, được đưa qua đúng ImageManager.ingest như khi người dùng chọn ảnh
+def make_source_images(rng, folder, count, size=(1600, 1200)):
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"nguon_{i}.jpg")
+        if not os.path.exists(path):
+            img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(40):
+                x, y = rng.randrange(size[0]), rng.randrange(size[1])
+                draw.ellipse((x, y, x + rng.randrange(50, 600), y + rng.randrange(50, 600)),
+                             fill=tuple(rng.randrange(256) for _ in range(3)))
+            img.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate(database, scale, image_paths, ingest, seed=0, batch_size=10000):
+    rng = random.Random(seed)
+    init_db(database)
+    with database.transaction() as cursor:
+        image_hashes = [tuple(ImageStore.put(cursor, blob) for blob in ingest(path)) for path in image_paths]
+    for batch in batched(product_rows(rng, scale, image_hashes), batch_size):
+        with database.transaction() as cursor:
+            cursor.executemany('''INSERT INTO sanpham
+                               (ma_sp, ten_sp, anh_hash, anh_nho_hash, gia_nhap, gia_ban, so_luong)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)''', batch)
+    for batch in batched(order_rows(rng, scale, date.today() - timedelta(days=700)), batch_size):
+        with database.transaction() as cursor:
+            cursor.executemany('''INSERT INTO khachhang
+                               (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+    database.execute("ANALYZE")
+
+def row_count(path, table):
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+        "rows": len(result) if isinstance(result, list) else None,
+    }
+
+# Mỗi thao tác gọi đúng repository, dòng ProductRow/OrderRow và định dạng hiển thị (values()) mà màn hình dùng
+def workflows(app, backend, image_paths, page_size=200):
+    products = backend.products
+    orders = backend.orders
+
+    def first_page(order_by="id", descending=False, min_price=None, max_price=None):
+        def run(i):
+            rows, _ = products.pager(page_size, order_by, descending, min_price, max_price).page_after(None)
+            return [ProductRow(*row).values() for row in rows]
+        return run
+
+    def fifth_page(i):
+        pager = products.pager(page_size, "ten_sp")
+        rows, anchor = [], None
+        for _ in range(5):
+            rows, _ = pager.page_after(anchor)
+            if not rows:
+                break
+            anchor = pager.key(rows[-1])
+        return [ProductRow(*row).values() for row in rows]
+
+    def search_products(i):
+        return [ProductRow(*row).values() for row in products.search(PRODUCT_QUERIES[i % len(PRODUCT_QUERIES)], 500)]
+
+    def load_orders(i):
+        return [row.values() for row in OrderRow.from_chunks(orders.stream(size=500))]
+
+    def filter_orders(i):
+        today = date.today()
+        return [OrderRow(*row).values() for row in orders.list(
+            "ngay_giao", True, "đang đặt", (today - timedelta(days=90)).isoformat(), today.isoformat())]
+
+    def due_this_week(i):
+        monday = date.today() - timedelta(days=date.today().weekday())
+        return [OrderRow(*row).values() for row in orders.due_between(
+            monday.isoformat(), (monday + timedelta(days=6)).isoformat(), "đang đặt")]
+
+    def search_orders(i):
+        return [OrderRow(*row).values() for row in orders.search(ORDER_QUERIES[i % len(ORDER_QUERIES)], 500)]
+
+    created_products = []
+    created_orders = []
+
+    def ingest_image(i):
+        return app.ImageManager.ingest(image_paths[i % len(image_paths)])
+
+    def save_product(i):
+        images = app.ImageManager.ingest(image_paths[i % len(image_paths)])
+        product_id = products.insert(f"BENCH-{time.time_ns()}-{i}", "Sản phẩm thử", 100000, 150000, 1000, images)
+        created_products.append(product_id)
+        return products.get(product_id)
+
+    def update_product(i):
+        product_id = created_products[i % len(created_products)]
+        product = products.get(product_id)
+        products.update(product_id, product[1], f"Sản phẩm thử {i}", 100000, 160000 + i, 1000)
+        return products.get(product_id)
+
+    def save_order(i):
+        items = [(product_id, 1, 150000) for product_id in created_products[:2]]
+        order_id = orders.insert("Khách thử", "Quà tặng", date.today().isoformat(),
+                                 (date.today() + timedelta(days=3)).isoformat(), "", 0, 0, "đang đặt", items)
+        created_orders.append(order_id)
+        return orders.get(order_id)
+
+    def update_order(i):
+        order_id = created_orders[i % len(created_orders)]
+        order = orders.get(order_id)
+        orders.update(order_id, order[1], order[2], order[3], order[4], order[5], order[6], order[7], order[9],
+                      [(created_products[0], 2, 150000)])
+        return orders.get(order_id)
+
+    def set_status(i):
+        orders.set_status_many(created_orders, "đã về" if i % 2 else "đang đặt")
+        return orders.get_many(created_orders)
+
+    def report_summary(i):
+        return backend.reports.summary("thang")
+
+    def inventory_report(i):
+        return backend.inventory_report(20, 5)["top_value"]
+
+    def cleanup():
+        if created_orders:
+            orders.delete_many(created_orders)
+        if created_products:
+            products.delete_many(created_products)
+
+    return {
+        "load_products.first_page": first_page(),
+        "load_products.sorted_desc_page": first_page("gia_ban", True),
+        "load_products.price_filter": first_page("id", False, 200000, 800000),
+        "load_products.fifth_page_by_name": fifth_page,
+        "search_products": search_products,
+        "load_orders.all": load_orders,
+        "load_orders.filtered": filter_orders,
+        "load_orders.due_this_week": due_this_week,
+        "search_orders": search_orders,
+        "save_product.ingest_image": ingest_image,
+        "save_product.insert": save_product,
+        "save_product.update": update_product,
+        "save_order.insert_with_items": save_order,
+        "save_order.update": update_order,
+        "save_order.set_status": set_status,
+        "reports.summary_by_month": report_summary,
+        "analytics.inventory_report": inventory_report,
+    }, cleanup
+
+# Bộ nhớ Python mà lưới đơn hàng giữ sau khi nạp toàn bộ (TreeSync.values: id -> OrderRow) và mức cao nhất
+# trong lúc đọc; không tính phần dữ liệu Tk tự giữ
+def measure_memory(orders):
+    tracemalloc.start()
+    try:
+        rows = {str(row.id): row for row in OrderRow.from_chunks(orders.stream(size=500))}
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "rows": len(rows),
+        "retained_bytes": retained,
+        "peak_bytes": peak,
+        "bytes_per_row": round(retained / len(rows)) if rows else None,
+    }
+
+def run_scale(app, scale, workdir, image_paths, repeat, regenerate, seed):
+    path = os.path.join(workdir, f"bench_{scale}.db")
+    result = {"database": path}
+    if regenerate or row_count(path, "sanpham") != scale or row_count(path, "khachhang") != scale:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        database = Database(path)
+        start = time.perf_counter()
+        generate(database, scale, image_paths, app.ImageManager.ingest, seed)
+        result["generate_s"] = round(time.perf_counter() - start, 2)
+    else:
+        database = Database(path)
+        init_db(database)
+    result["database_bytes"] = os.path.getsize(path)
+
+    backend = LocalBackend(database)
+    tasks, cleanup = workflows(app, backend, image_paths)
+    timings = {}
+    try:
+        for name, fn in tasks.items():
+            print(f"[{scale:,}] {name}", file=sys.stderr)
+            timings[name] = timed(fn, repeat)
+        result["memory.load_orders"] = measure_memory(backend.orders)
+    finally:
+        cleanup()
+        database.close()
+    result["workflows"] = timings
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian các thao tác sản phẩm/đơn hàng trên dữ liệu giả lập, "
+                                                 "không cần màn hình")
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="số sản phẩm và số đơn hàng của mỗi bộ dữ liệu, cách nhau bằng dấu phẩy")
+    parser.add_argument("--workdir", default="bench_data", help="thư mục chứa CSDL và ảnh giả lập (được dùng lại)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--images", type=int, default=20, help="số ảnh gốc khác nhau")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="tạo lại dữ liệu kể cả khi đã có")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(workdir, exist_ok=True)
+    import main as app
+
+    image_paths = make_source_images(random.Random(args.seed), workdir, args.images)
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "image_format": app.ImageManager.image_format(),
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for scale in (int(value) for value in args.scales.split(",") if value.strip()):
+        results["scales"][str(scale)] = run_scale(app, scale, workdir, image_paths, args.repeat, args.regenerate,
+                                                  args.seed)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import csv
+import io
+import os
+import sqlite3
+from datetime import date
+
+from database import to_iso_date, to_display_date
+
+# Tiêu đề cột trong file CSV -> cột trong CSDL; None là cột chỉ có khi xuất (STT, số tiền còn thiếu)
+ORDER_CSV_COLUMNS = (
+    ("STT", None),
+    ("Tên", "ten_kh"),
+    ("Danh mục", "danh_muc"),
+    ("Ngày đặt", "ngay_dat"),
+    ("Ngày giao", "ngay_giao"),
+    ("File SP", "file_sp"),
+    ("Tiền tổng", "tong_tien"),
+    ("Tiền cọc", "da_coc"),
+    ("Tiền còn thiếu", None),
+    ("Trạng thái", "trang_thai"),
+)
+
+PRODUCT_CSV_COLUMNS = (
+    ("STT", None),
+    ("Mã SP", "ma_sp"),
+    ("Tên SP", "ten_sp"),
+    ("Giá nhập", "gia_nhap"),
+    ("Giá bán", "gia_ban"),
+    ("Số lượng", "so_luong"),
+)
+
+class CsvImportError(Exception):
+    pass
+
+class ImportResult:
+    MAX_ERRORS = 100
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_error(self, message, count=1):
+        self.skipped += count
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(message)
+
+def parse_money(value):
+    value = value.strip().replace(",", "").replace("đ", "")
+    if not value:
+        return 0.0
+    amount = float(value)
+    if amount < 0:
+        raise ValueError("số tiền không được âm")
+    return amount
+
+def parse_quantity(value):
+    value = value.strip().replace(",", "")
+    quantity = int(float(value)) if value else 0
+    if quantity < 0:
+        raise ValueError("số lượng không được âm")
+    return quantity
+
+def parse_date(value):
+    value = value.strip()
+    if not value:
+        return ""
+    if "/" in value:
+        return to_iso_date(value)
+    return date.fromisoformat(value).isoformat()
+
+def parse_order(fields):
+    ten_kh = fields.get("ten_kh", "").strip()
+    if not ten_kh:
+        raise ValueError("thiếu tên khách hàng")
+    tong_tien = parse_money(fields.get("tong_tien", ""))
+    da_coc = parse_money(fields.get("da_coc", ""))
+    if da_coc > tong_tien:
+        raise ValueError("số tiền cọc lớn hơn tổng tiền")
+    return (ten_kh, fields.get("danh_muc", "").strip(), parse_date(fields.get("ngay_dat", "")),
+            parse_date(fields.get("ngay_giao", "")), fields.get("file_sp", "").strip(),
+            tong_tien, da_coc, fields.get("trang_thai", "").strip() or "đang đặt")
+
+def parse_product(fields):
+    ma_sp = fields.get("ma_sp", "").strip()
+    ten_sp = fields.get("ten_sp", "").strip()
+    if not ma_sp or not ten_sp:
+        raise ValueError("thiếu mã hoặc tên sản phẩm")
+    return (ma_sp, ten_sp, parse_money(fields.get("gia_nhap", "")), parse_money(fields.get("gia_ban", "")),
+            parse_quantity(fields.get("so_luong", "")))
+
+TABLES = {
+    "khachhang": {
+        "columns": ORDER_CSV_COLUMNS,
+        "parse": parse_order,
+        "insert": '''INSERT INTO khachhang
+                  (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        "select": "SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, "
+                  "con_thieu, trang_thai FROM khachhang ORDER BY id",
+        "dates": (3, 4),
+    },
+    "sanpham": {
+        "columns": PRODUCT_CSV_COLUMNS,
+        "parse": parse_product,
+        "insert": '''INSERT INTO sanpham (ma_sp, ten_sp, gia_nhap, gia_ban, so_luong)
+                  VALUES (?, ?, ?, ?, ?)''',
+        "select": "SELECT id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong FROM sanpham ORDER BY id",
+        "dates": (),
+    },
+}
+
+def resolve_header(header, columns):
+    names = {name.strip().lower(): column for name, column in columns if column}
+    mapping = [names.get(name.strip().lower()) for name in header]
+    if not any(mapping):
+        raise CsvImportError("Tiêu đề file CSV không khớp với bảng dữ liệu!")
+    return mapping
+
+# Đọc từng dòng, ghi theo lô bằng executemany; mỗi lô là một việc ngắn của WriteService nên các thao tác lưu khác
+# chỉ phải chờ một lô. on_error là "skip" hoặc "abort". "abort" kiểm tra cả file trước khi ghi và nếu lô nào vẫn lỗi
+# khi ghi (vd. trùng mã) thì xóa lại các lô đã ghi: không bao giờ để lại file nhập dở (máy khác có thể thấy các dòng
+# mới trong lúc đang nhập). Lỗi dừng nhập luôn nói rõ đã ghi bao nhiêu dòng
+def import_csv(database, table, path, on_error="skip", batch_size=5000, progress=None):
+    spec = TABLES[table]
+    insert_sql = spec["insert"].replace("INSERT INTO", "INSERT OR IGNORE INTO") if on_error == "skip" else spec["insert"]
+    result = ImportResult()
+    written = []
+    try:
+        if on_error == "abort":
+            for first_line, last_line, batch, fraction in read_batches(spec, path, on_error, batch_size, result):
+                if progress:
+                    progress(last_line - 1, fraction)
+        for first_line, last_line, batch, fraction in read_batches(spec, path, on_error, batch_size, result):
+            written.append(write_batch(database, table, insert_sql, batch, result, first_line, last_line))
+            if progress:
+                progress(result.imported, fraction)
+    except CsvImportError as e:
+        if on_error == "abort":
+            for id_range in written:
+                database.writes.call(delete_range, database, table, *id_range)
+            note = "Đã hủy, không có dòng nào được ghi."
+        else:
+            note = f"Đã ghi {result.imported:,} dòng trước lỗi này."
+        raise CsvImportError(f"{e}\n{note}") from e
+    if progress:
+        progress(result.imported, 1.0)
+    return result
+
+# Trả về từng lô (dòng đầu, dòng cuối, các dòng đã chuyển đổi, phần file đã đọc)
+def read_batches(spec, path, on_error, batch_size, result):
+    total_bytes = os.path.getsize(path) or 1
+    with open(path, "rb") as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+        header = next(reader, None)
+        if header is None:
+            return
+        mapping = resolve_header(header, spec["columns"])
+
+        batch = []
+        first_line = None
+        for line_no, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            try:
+                fields = {column: value for column, value in zip(mapping, row) if column}
+                batch.append(spec["parse"](fields))
+                first_line = first_line or line_no
+            except ValueError as e:
+                if on_error == "abort":
+                    raise CsvImportError(f"Dòng {line_no}: {e}")
+                result.add_error(f"Dòng {line_no}: {e}")
+
+            if len(batch) >= batch_size:
+                yield first_line, line_no, batch, min(raw.tell() / total_bytes, 1.0)
+                batch = []
+                first_line = None
+        if batch:
+            yield first_line, line_no, batch, 1.0
+
+# Chạy trên luồng ghi: id mới trong một giao dịch nằm liền nhau sau max(id) cũ nên trả về khoảng (đầu, cuối]
+def insert_batch(database, table, insert_sql, batch):
+    with database.transaction() as cursor:
+        before = cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]
+        cursor.executemany(insert_sql, batch)
+        inserted = cursor.rowcount
+        return inserted, before, cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]
+
+def delete_range(database, table, first_id, last_id):
+    with database.transaction() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id > ? AND id <= ?", (first_id, last_id))
+
+def write_batch(database, table, insert_sql, batch, result, first_line, last_line):
+    try:
+        inserted, first_id, last_id = database.writes.call(insert_batch, database, table, insert_sql, batch)
+    except sqlite3.IntegrityError as e:
+        raise CsvImportError(f"Dòng {first_line}-{last_line} có mã bị trùng: {e}")
+    result.imported += inserted
+    if inserted < len(batch):
+        result.add_error(f"Dòng {first_line}-{last_line}: {len(batch) - inserted} dòng trùng mã đã có",
+                         len(batch) - inserted)
+    return first_id, last_id
+
+def export_csv(database, table, path, batch_size=5000, progress=None):
+    spec = TABLES[table]
+    cursor = database.conn.execute(spec["select"])
+    exported = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in spec["columns"]])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                row = list(row)
+                for index in spec["dates"]:
+                    row[index] = to_display_date(row[index])
+                writer.writerow(row)
+            exported += len(rows)
+            if progress:
+                progress(exported, None)
+    return exported
@@ -0,0 +1,1005 @@
+import sqlite3
+import threading
+import hashlib
+import os
+import queue
+import random
+import re
+import time
+import unicodedata
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from profiling import ProfiledConnection, profiler
+
+DB_PATH = "quanlybanhang.db"
+# Chờ tối đa bấy nhiêu khi máy/tiến trình khác đang giữ khóa ghi trước khi báo bận (PRAGMA busy_timeout)
+BUSY_TIMEOUT_MS = 5000
+
+# WAL dùng bộ nhớ chung (file -shm) giữa các tiến trình nên chỉ an toàn khi mọi chương trình mở CSDL trên cùng một
+# máy. CSDL nằm trên ổ mạng/thư mục chia sẻ (\\máy\thư-mục, ổ mạng, NFS/SMB) thì tự dùng journal DELETE và không
+# dùng mmap; nhiều máy dùng chung nên chạy server.py và đặt QLBH_SERVER trên các máy bán hàng. Máy đang chia sẻ thư
+# mục chứa CSDL thấy đường dẫn cục bộ nên phải đặt QLBH_JOURNAL_MODE=DELETE nếu máy khác vẫn mở file qua mạng
+JOURNAL_MODE = os.environ.get("QLBH_JOURNAL_MODE", "auto").upper()
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "afpfs", "9p", "fuse.sshfs", "davfs", "webdav"}
+DRIVE_REMOTE = 4
+
+# auto_vacuum phải đặt trước journal_mode mới có tác dụng với CSDL mới; CSDL cũ chuyển bằng
+# maintenance.enable_incremental_vacuum
+AUTO_VACUUM_PRAGMA = "PRAGMA auto_vacuum=INCREMENTAL"
+PRAGMAS = (
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+)
+MMAP_PRAGMA = "PRAGMA mmap_size=268435456"
+
+def is_network_path(path):
+    if path.startswith(("\\\\", "//")):
+        return True
+    path = os.path.realpath(path)
+    if os.name == "nt":
+        import ctypes
+        drive = os.path.splitdrive(path)[0]
+        return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == DRIVE_REMOTE
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    # Điểm gắn dài nhất chứa đường dẫn
+    mount = max((m for m in mounts if path == m[0] or path.startswith(m[0].rstrip("/") + "/")),
+                key=lambda m: len(m[0]), default=None)
+    return mount is not None and mount[1] in NETWORK_FS_TYPES
+
+def choose_journal_mode(path):
+    network = is_network_path(path)
+    if JOURNAL_MODE in ("WAL", "DELETE"):
+        mode = JOURNAL_MODE
+    else:
+        mode = "DELETE" if network else "WAL"
+    if mode == "WAL" and network:
+        raise sqlite3.OperationalError(f"Không thể dùng WAL cho CSDL trên ổ mạng ({path}); "
+                                       "hãy dùng server.py hoặc QLBH_JOURNAL_MODE=DELETE")
+    return mode, network
+
+# Mỗi luồng giữ một kết nối lâu dài; câu lệnh đã biên dịch được sqlite3 cache theo chuỗi SQL
+class Database:
+    def __init__(self, path=DB_PATH, cached_statements=256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.write_service = None
+        self.journal_mode = None
+        self.network = False
+
+    def connect(self):
+        if self.journal_mode is None:
+            self.journal_mode, self.network = choose_journal_mode(self.path)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=self.cached_statements,
+                               check_same_thread=False, factory=ProfiledConnection)
+        conn.execute(AUTO_VACUUM_PRAGMA)
+        mode = conn.execute(f"PRAGMA journal_mode={self.journal_mode}").fetchone()[0].upper()
+        # Không chuyển được khỏi WAL khi còn chương trình khác đang mở file ở chế độ WAL
+        if mode != self.journal_mode and self.network:
+            conn.close()
+            raise sqlite3.OperationalError("CSDL trên ổ mạng đang được mở ở chế độ WAL; hãy đóng chương trình trên "
+                                           "các máy khác hoặc dùng server.py")
+        # Với journal DELETE, synchronous=NORMAL có thể làm hỏng CSDL khi mất điện nên dùng FULL
+        conn.execute(f"PRAGMA synchronous={'NORMAL' if mode == 'WAL' else 'FULL'}")
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if not self.network:
+            conn.execute(MMAP_PRAGMA)
+        return conn
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connect()
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def query(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    # Đọc từng đợt (fetchmany) để không phải giữ cả kết quả lớn dưới dạng tuple cùng lúc
+    def query_chunks(self, sql, params=(), size=1000):
+        cursor = self.conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+
+    def query_one(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        with self.transaction() as cursor:
+            return cursor.execute(sql, params)
+
+    # Giao dịch luôn giành khóa ghi ngay từ đầu (BEGIN IMMEDIATE): chờ theo busy_timeout thay vì bị SQLITE_BUSY
+    # giữa chừng khi giao dịch đọc rồi mới ghi. Gọi lồng bên trong một giao dịch (vd. nhóm của WriteService) thì
+    # dùng chung giao dịch ngoài; không dùng SAVEPOINT vì FTS5 ghi chỉ mục ra đĩa ở mỗi SAVEPOINT nên rất chậm
+    @contextmanager
+    def transaction(self):
+        conn = self.conn
+        if getattr(self.local, "in_transaction", False):
+            yield conn.cursor()
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self.local.in_transaction = True
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self.local.in_transaction = False
+
+    # Giao dịch chỉ đọc: các câu lệnh bên trong cùng thấy một thời điểm của CSDL (vd. đếm rồi đọc)
+    @contextmanager
+    def read_transaction(self):
+        conn = self.conn
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.commit()
+
+    @property
+    def writes(self):
+        with self.lock:
+            if self.write_service is None:
+                self.write_service = WriteService(self)
+            return self.write_service
+
+    def close(self):
+        if self.write_service is not None:
+            self.write_service.stop()
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    pass
+
+# SQLITE_BUSY/SQLITE_LOCKED kể cả mã mở rộng (vd. SQLITE_BUSY_SNAPSHOT)
+def is_busy(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is None:
+        return "locked" in str(error) or "busy" in str(error)
+    return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+# Mọi lệnh ghi của repository chạy trên một luồng ghi duy nhất. Các lệnh đến dồn dập (vd. quét giao hàng liên tục,
+# nhiều máy qua server.py) được gom vào một giao dịch - một lần commit (group commit). Lệnh nào trong nhóm lỗi thì hủy
+# cả nhóm và chạy lại từng lệnh trong giao dịch riêng. Tiến trình khác đang giữ khóa ghi thì thử lại các lệnh chưa
+# xong với thời gian chờ tăng dần (có ngẫu nhiên); busy_timeout của kết nối ghi để ngắn vì các lần ngủ của SQLite
+# thô hơn nên khóa hay bị bỏ trống khi nhiều tiến trình cùng ghi
+class WriteService:
+    MAX_GROUP = 64
+    BUSY_TIMEOUT_MS = 10
+    BACKOFF_S = 0.001
+    MAX_BACKOFF_S = 0.01
+    GIVE_UP_S = 10
+
+    def __init__(self, database):
+        self.database = database
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="qlbh-writer", daemon=True)
+                self.thread.start()
+            self.jobs.put((future, partial(fn, *args)))
+        return future
+
+    # Gọi từ phương thức ghi lồng nhau (vd. delete -> delete_many) thì chạy luôn trong nhóm hiện tại
+    def call(self, fn, *args):
+        if threading.current_thread() is self.thread:
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    def run(self):
+        self.database.conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            group = [job]
+            while len(group) < self.MAX_GROUP:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self.jobs.put(None)
+                    break
+                group.append(job)
+            self.commit(group)
+
+    def commit(self, group):
+        deadline = time.monotonic() + self.GIVE_UP_S
+        delay = self.BACKOFF_S
+        while True:
+            try:
+                with profiler.measure("write.commit", len(group)):
+                    self.run_group(group)
+                return
+            except sqlite3.OperationalError:
+                group = [job for job in group if not job[0].done()]
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(self.MAX_BACKOFF_S, delay * 2)
+        error = DatabaseBusyError("Cơ sở dữ liệu đang bận (máy khác đang ghi), vui lòng thử lại sau!")
+        for future, _ in group:
+            future.set_exception(error)
+
+    # Kết quả chỉ được trả về sau khi commit để luồng khác đọc lại là thấy ngay; chỉ lỗi CSDL bận được ném ra
+    def run_group(self, group):
+        if len(group) > 1:
+            try:
+                with self.database.transaction():
+                    results = [fn() for _, fn in group]
+            except Exception as e:
+                if is_busy(e):
+                    raise
+            else:
+                for (future, _), result in zip(group, results):
+                    future.set_result(result)
+                return
+        for future, fn in group:
+            try:
+                with self.database.transaction():
+                    result = fn()
+            except Exception as e:
+                if is_busy(e):
+                    raise
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+            if thread is not None:
+                self.jobs.put(None)
+        if thread is not None:
+            thread.join()
+
+# Phương thức ghi của repository: chạy qua WriteService của CSDL
+def write_method(fn):
+    @wraps(fn)
+    def write(self, *args, **kwargs):
+        return self.db.writes.call(lambda: fn(self, *args, **kwargs))
+    return write
+
+db = Database()
+
+# Tăng SCHEMA_VERSION mỗi khi đổi lược đồ trong init_db; CSDL đã đúng phiên bản (PRAGMA user_version) thì
+# khởi động chỉ tốn một lệnh PRAGMA thay vì chạy lại mọi CREATE/kiểm tra chuyển đổi
+SCHEMA_VERSION = 1
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Khởi tạo CSDL
+def init_db(database=db):
+    if schema_version(database.conn) >= SCHEMA_VERSION:
+        return
+    with database.transaction() as cursor:
+        # Kiểm tra lại khi đã giữ khóa ghi: tiến trình khác có thể vừa nâng cấp xong
+        if schema_version(cursor) >= SCHEMA_VERSION:
+            return
+        cursor.execute('''CREATE TABLE IF NOT EXISTS sanpham (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ma_sp TEXT UNIQUE,
+                        ten_sp TEXT,
+                        anh_hash TEXT REFERENCES hinhanh(hash),
+                        anh_nho_hash TEXT REFERENCES hinhanh(hash),
+                        gia_nhap REAL,
+                        gia_ban REAL,
+                        so_luong INTEGER)''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS hinhanh (
+                        hash TEXT PRIMARY KEY,
+                        du_lieu BLOB NOT NULL)''')
+        migrate_inline_images(cursor)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sanpham_anh_hash ON sanpham(anh_hash)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sanpham_anh_nho_hash ON sanpham(anh_nho_hash)")
+        cursor.execute('''CREATE TABLE IF NOT EXISTS khachhang (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ten_kh TEXT,
+                        danh_muc TEXT,
+                        ngay_dat TEXT,
+                        ngay_giao TEXT,
+                        file_sp TEXT,
+                        tong_tien REAL,
+                        da_coc REAL,
+                        con_thieu REAL GENERATED ALWAYS AS (tong_tien - da_coc) VIRTUAL,
+                        trang_thai TEXT)''')
+        migrate_order_dates(cursor)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_khachhang_ngay_dat ON khachhang(ngay_dat)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_khachhang_ngay_giao ON khachhang(ngay_giao)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_khachhang_ten_kh ON khachhang(ten_kh)")
+        # Chỉ mục bao phủ các cột của lưới đơn hàng, bắt đầu bằng trang_thai, ngay_giao cho truy vấn "cần giao"
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_khachhang_trang_thai_grid ON khachhang(
+                        trang_thai, ngay_giao, ten_kh, danh_muc, ngay_dat, file_sp, tong_tien, da_coc)''')
+        # Chỉ mục cho sắp xếp theo tiêu đề cột (xem ProductRepository.SORT_COLUMNS, OrderRepository.SORT_COLUMNS)
+        for column, null_value in ProductRepository.SORT_COLUMNS.items():
+            if null_value is not None:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_sanpham_sort_{column} "
+                               f"ON sanpham({sort_expression(column, null_value)})")
+        for column in ("danh_muc", "tong_tien", "da_coc", "con_thieu"):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_khachhang_{column} ON khachhang({column})")
+        create_search_index(cursor, "sanpham", ("ma_sp", "ten_sp"))
+        create_search_index(cursor, "khachhang", ("ten_kh", "danh_muc"))
+        create_report_rollup(cursor)
+        cursor.execute('''CREATE TABLE IF NOT EXISTS chitiet_donhang (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        don_hang_id INTEGER NOT NULL REFERENCES khachhang(id),
+                        san_pham_id INTEGER NOT NULL REFERENCES sanpham(id),
+                        so_luong INTEGER NOT NULL CHECK (so_luong > 0),
+                        don_gia REAL NOT NULL)''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chitiet_donhang_don_hang ON chitiet_donhang(don_hang_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chitiet_donhang_san_pham ON chitiet_donhang(san_pham_id)")
+        create_order_total_triggers(cursor)
+        create_change_log(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# Chuyển ảnh lưu trực tiếp trong sanpham.anh_sp (bản cũ) sang bảng hinhanh
+def migrate_inline_images(cursor):
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(sanpham)")]
+    if "anh_hash" not in columns:
+        cursor.execute("ALTER TABLE sanpham ADD COLUMN anh_hash TEXT REFERENCES hinhanh(hash)")
+    if "anh_nho_hash" not in columns:
+        cursor.execute("ALTER TABLE sanpham ADD COLUMN anh_nho_hash TEXT REFERENCES hinhanh(hash)")
+    if "anh_sp" not in columns:
+        return
+
+    product_ids = [row[0] for row in cursor.execute(
+        "SELECT id FROM sanpham WHERE typeof(anh_sp) = 'blob'").fetchall()]
+    for product_id in product_ids:
+        blob_data = cursor.execute("SELECT anh_sp FROM sanpham WHERE id=?", (product_id,)).fetchone()[0]
+        cursor.execute("UPDATE sanpham SET anh_hash=? WHERE id=?",
+                       (ImageStore.put(cursor, blob_data), product_id))
+    cursor.execute("ALTER TABLE sanpham DROP COLUMN anh_sp")
+
+# unicode61 bỏ dấu được các chữ có dấu nhưng "đ" không tách dấu nên phải thay trước khi đánh chỉ mục
+def fold_sql(expr):
+    return f"replace(replace({expr}, 'đ', 'd'), 'Đ', 'D')"
+
+def fold_text(text):
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+# Chỉ chấm điểm bm25 cho một số ứng viên giới hạn để từ khóa quá chung (vd "san") vẫn trả về trong vài chục ms;
+# ứng viên lấy theo rowid giảm dần nên khi bị cắt bớt thì giữ các bản ghi mới nhất
+RANK_CANDIDATE_FACTOR = 4
+
+def search_tokens(text):
+    return re.findall(r"[^\W_]+", fold_text(text))
+
+def build_match_query(query):
+    return " ".join(f'"{token}"*' for token in search_tokens(query))
+
+# Cùng quy tắc với MATCH: mỗi từ khóa phải là tiền tố của một từ trong các cột được tìm
+def matches_query(query_tokens, texts):
+    words = search_tokens(" ".join(text or "" for text in texts))
+    return all(any(word.startswith(token) for word in words) for token in query_tokens)
+
+# Bảng FTS5 <table>_fts dùng rowid = id của bảng gốc, được đồng bộ bằng trigger
+def create_search_index(cursor, table, columns):
+    fts_table = f"{table}_fts"
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                            (fts_table,)).fetchone()
+    column_list = ", ".join(columns)
+    new_values = ", ".join(fold_sql(f"new.{column}") for column in columns)
+    cursor.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                    {column_list}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+                    DELETE FROM {fts_table} WHERE rowid = old.id;
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                    UPDATE {fts_table} SET ({column_list}) = ({new_values}) WHERE rowid = new.id;
+                    END''')
+    if not exists:
+        cursor.execute(f"INSERT INTO {fts_table} (rowid, {column_list}) "
+                       f"SELECT id, {', '.join(fold_sql(column) for column in columns)} FROM {table}")
+
+# Bảng tổng hợp doanh thu theo ngày đặt, tháng, danh mục và trạng thái; trigger cộng/trừ từng đơn khi
+# khachhang thay đổi nên màn hình báo cáo chỉ đọc vài dòng thay vì quét cả bảng
+REPORT_GROUPS = (
+    ("ngay", "coalesce({0}.ngay_dat, '')"),
+    ("thang", "substr(coalesce({0}.ngay_dat, ''), 1, 7)"),
+    ("danh_muc", "coalesce({0}.danh_muc, '')"),
+    ("trang_thai", "coalesce({0}.trang_thai, '')"),
+)
+
+def rollup_upsert(row, sign):
+    values = ", ".join(f"('{group}', {key.format(row)}, {sign}1, {sign}coalesce({row}.tong_tien, 0), "
+                       f"{sign}coalesce({row}.da_coc, 0))" for group, key in REPORT_GROUPS)
+    return f'''INSERT INTO baocao_tonghop (nhom, khoa, so_don, tong_tien, da_coc) VALUES {values}
+                    ON CONFLICT (nhom, khoa) DO UPDATE SET so_don = so_don + excluded.so_don,
+                    tong_tien = tong_tien + excluded.tong_tien, da_coc = da_coc + excluded.da_coc;'''
+
+def create_report_rollup(cursor):
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='baocao_tonghop'").fetchone()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS baocao_tonghop (
+                    nhom TEXT NOT NULL,
+                    khoa TEXT NOT NULL,
+                    so_don INTEGER NOT NULL DEFAULT 0,
+                    tong_tien REAL NOT NULL DEFAULT 0,
+                    da_coc REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (nhom, khoa)) WITHOUT ROWID''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS baocao_tonghop_ai AFTER INSERT ON khachhang BEGIN
+                    {rollup_upsert("new", "")}
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS baocao_tonghop_ad AFTER DELETE ON khachhang BEGIN
+                    {rollup_upsert("old", "-")}
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS baocao_tonghop_au
+                    AFTER UPDATE OF ngay_dat, danh_muc, trang_thai, tong_tien, da_coc ON khachhang BEGIN
+                    {rollup_upsert("old", "-")}
+                    {rollup_upsert("new", "")}
+                    END''')
+    if not exists:
+        for group, key in REPORT_GROUPS:
+            cursor.execute(f"INSERT INTO baocao_tonghop (nhom, khoa, so_don, tong_tien, da_coc) "
+                           f"SELECT '{group}', {key.format('khachhang')}, count(*), "
+                           f"total(tong_tien), total(da_coc) FROM khachhang GROUP BY 2")
+
+# Đơn có chi tiết thì tong_tien luôn bằng tổng thành tiền các dòng; đơn cũ không có chi tiết giữ số nhập tay
+def create_order_total_triggers(cursor):
+    for event, row in (("INSERT", "new"), ("DELETE", "old"), ("UPDATE", "new")):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS chitiet_donhang_{event.lower()} AFTER {event} ON chitiet_donhang
+                        BEGIN
+                        UPDATE khachhang SET tong_tien = (SELECT total(so_luong * don_gia) FROM chitiet_donhang
+                        WHERE don_hang_id = {row}.don_hang_id) WHERE id = {row}.don_hang_id;
+                        END''')
+
+CHANGE_TABLES = ("sanpham", "khachhang")
+
+def change_upsert(table, row, deleted):
+    return f'''INSERT INTO thaydoi (bang, ban_ghi_id, phien_ban, da_xoa) VALUES ('{table}', {row}.id,
+                    (SELECT coalesce(max(phien_ban), 0) + 1 FROM thaydoi WHERE bang = '{table}'), {deleted})
+                    ON CONFLICT (bang, ban_ghi_id) DO UPDATE SET phien_ban = excluded.phien_ban,
+                    da_xoa = excluded.da_xoa;'''
+
+# Mỗi dòng bị thêm/sửa/xóa chỉ giữ một bản ghi với số phiên bản mới nhất của bảng, nên bảng thaydoi
+# không lớn hơn số dòng từng thay đổi; màn hình đang mở chỉ cần đọc các dòng có phien_ban lớn hơn lần trước
+def create_change_log(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS thaydoi (
+                    bang TEXT NOT NULL,
+                    ban_ghi_id INTEGER NOT NULL,
+                    phien_ban INTEGER NOT NULL,
+                    da_xoa INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bang, ban_ghi_id)) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_thaydoi_phien_ban ON thaydoi(bang, phien_ban)")
+    for table in CHANGE_TABLES:
+        for event, row, deleted in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1)):
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS thaydoi_{table}_{event.lower()} AFTER {event} ON {table}
+                            BEGIN
+                            {change_upsert(table, row, deleted)}
+                            END''')
+
+DISPLAY_DATE_FORMAT = "%d/%m/%Y"
+OLD_DATE_GLOB = "[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]"
+
+# Ngày được lưu dạng ISO (yyyy-mm-dd) để so sánh, sắp xếp và quét theo khoảng bằng chỉ mục
+def to_iso_date(text):
+    if not text:
+        return ""
+    return datetime.strptime(text, DISPLAY_DATE_FORMAT).date().isoformat()
+
+def to_display_date(iso_date):
+    if iso_date and len(iso_date) == 10 and iso_date[4] == "-":
+        return f"{iso_date[8:10]}/{iso_date[5:7]}/{iso_date[0:4]}"
+    return iso_date or ""
+
+def migrate_order_dates(cursor):
+    for column in ("ngay_dat", "ngay_giao"):
+        cursor.execute(f'''UPDATE khachhang SET {column} =
+                        substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)
+                        WHERE {column} GLOB ?''', (OLD_DATE_GLOB,))
+
+class ImageStore:
+    @staticmethod
+    def hash_blob(blob_data):
+        return hashlib.sha256(blob_data).hexdigest()
+
+    @staticmethod
+    def put(cursor, blob_data):
+        image_hash = ImageStore.hash_blob(blob_data)
+        cursor.execute("INSERT OR IGNORE INTO hinhanh (hash, du_lieu) VALUES (?, ?)", (image_hash, blob_data))
+        return image_hash
+
+    @staticmethod
+    def get(cursor, image_hash):
+        if not image_hash:
+            return None
+        row = cursor.execute("SELECT du_lieu FROM hinhanh WHERE hash=?", (image_hash,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def release(cursor, image_hash):
+        if image_hash:
+            cursor.execute("DELETE FROM hinhanh WHERE hash=? AND NOT EXISTS "
+                           "(SELECT 1 FROM sanpham WHERE anh_hash=?) AND NOT EXISTS "
+                           "(SELECT 1 FROM sanpham WHERE anh_nho_hash=?)", (image_hash, image_hash, image_hash))
+
+# Biểu thức sắp xếp không có NULL để so sánh keyset (giá trị, id) luôn đúng; phải trùng với biểu thức của chỉ mục
+def sort_expression(column, null_value):
+    return f"coalesce({column}, {null_value!r})"
+
+# Phân trang theo id, hoặc theo (order_by, id) khi sắp xếp theo một cột; anchor là khóa của dòng mốc (xem key)
+class KeysetPager:
+    def __init__(self, database, table, columns, where="", params=(), page_size=200, max_cached_pages=16,
+                 order_by=None, null_value=0, descending=False):
+        self.db = database
+        self.table = table
+        self.columns = columns
+        self.where = where
+        self.params = tuple(params)
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.order_by = order_by
+        self.null_value = null_value
+        self.descending = descending
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, row):
+        if self.order_by is None:
+            return row[0]
+        value = row[self.columns.index(self.order_by)]
+        return (self.null_value if value is None else value, row[0])
+
+    # True nếu khóa key đứng sau anchor theo thứ tự hiển thị
+    def is_after(self, key, anchor):
+        return key < anchor if self.descending else key > anchor
+
+    def _fetch(self, anchor, forward):
+        ascending = forward != self.descending
+        op = ">" if ascending else "<"
+        conditions = []
+        params = []
+        if self.order_by is None:
+            if anchor is not None:
+                conditions.append(f"id {op} ?")
+                params.append(anchor)
+            order = f"id {'ASC' if ascending else 'DESC'}"
+        else:
+            expr = sort_expression(self.order_by, self.null_value)
+            if anchor is not None:
+                # Điều kiện "expr >= ?" giúp SQLite tìm thẳng tới vị trí mốc trong chỉ mục
+                conditions.append(f"{expr} {op}= ? AND ({expr}, id) {op} (?, ?)")
+                params.extend((anchor[0], anchor[0], anchor[1]))
+            direction = "ASC" if ascending else "DESC"
+            order = f"{expr} {direction}, id {direction}"
+        if self.where:
+            conditions.append(f"({self.where})")
+            params.extend(self.params)
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(self.page_size + 1)
+
+        rows = self.db.query(sql, params)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+        return rows, has_more
+
+    def _get(self, anchor, forward):
+        key = (anchor, forward)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        page = self._fetch(anchor, forward)
+        with self.lock:
+            self.cache[key] = page
+            while len(self.cache) > self.max_cached_pages:
+                self.cache.popitem(last=False)
+        return page
+
+    def page_after(self, anchor=None):
+        return self._get(anchor, True)
+
+    def page_before(self, anchor):
+        return self._get(anchor, False)
+
+    def prefetch_after(self, anchor):
+        self._get(anchor, True)
+
+    def prefetch_before(self, anchor):
+        self._get(anchor, False)
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+
+# Đọc nhiều dòng theo danh sách id, chia lô để không vượt giới hạn số tham số của SQLite
+def fetch_by_ids(conn, table, columns, ids, chunk_size=500):
+    rows = []
+    ids = list(ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        rows.extend(conn.execute(f"SELECT {', '.join(columns)} FROM {table} "
+                                 f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+    return rows
+
+class ProductRepository:
+    # anh_hash là ảnh xem (ImageManager.PREVIEW_SIZE), anh_nho_hash là ảnh nhỏ; sản phẩm cũ chỉ có anh_hash
+    COLUMNS = ("id", "ma_sp", "ten_sp", "anh_hash", "gia_nhap", "gia_ban", "so_luong", "anh_nho_hash")
+    # Cột được phép sắp xếp -> giá trị thay cho NULL (None: sắp theo id)
+    SORT_COLUMNS = {"id": None, "ma_sp": "", "ten_sp": "", "gia_nhap": 0, "gia_ban": 0, "so_luong": 0}
+
+    def __init__(self, database=db):
+        self.db = database
+
+    def pager(self, page_size=200, order_by="id", descending=False, min_price=None, max_price=None):
+        if order_by not in self.SORT_COLUMNS:
+            raise ValueError(f"Không thể sắp xếp theo cột {order_by}")
+        conditions = []
+        params = []
+        if min_price is not None:
+            conditions.append(f"{sort_expression('gia_ban', 0)} >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append(f"{sort_expression('gia_ban', 0)} <= ?")
+            params.append(max_price)
+        null_value = self.SORT_COLUMNS[order_by]
+        return KeysetPager(self.db, "sanpham", self.COLUMNS, " AND ".join(conditions), params, page_size,
+                           order_by=None if null_value is None else order_by, null_value=null_value,
+                           descending=descending)
+
+    def search(self, query, limit=500):
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+        return self.db.query("SELECT s.id, s.ma_sp, s.ten_sp, s.anh_hash, s.gia_nhap, s.gia_ban, s.so_luong, "
+                             "s.anh_nho_hash "
+                             "FROM (SELECT rowid, bm25(sanpham_fts, 2.0, 1.0) AS score FROM sanpham_fts "
+                             "WHERE sanpham_fts MATCH ? ORDER BY rowid DESC LIMIT ?) f "
+                             "JOIN sanpham s ON s.id = f.rowid ORDER BY f.score LIMIT ?",
+                             (match_query, limit * RANK_CANDIDATE_FACTOR, limit))
+
+    def get(self, product_id):
+        return self.db.query_one("SELECT id, ma_sp, ten_sp, anh_hash, gia_nhap, gia_ban, so_luong, anh_nho_hash "
+                                 "FROM sanpham WHERE id=?", (product_id,))
+
+    def get_many(self, product_ids):
+        return fetch_by_ids(self.db.conn, "sanpham", self.COLUMNS, product_ids)
+
+    def get_by_code(self, ma_sp):
+        return self.db.query_one("SELECT id, ma_sp, ten_sp, anh_hash, gia_nhap, gia_ban, so_luong, anh_nho_hash "
+                                 "FROM sanpham WHERE ma_sp=?", (ma_sp,))
+
+    def get_image_hash(self, product_id):
+        row = self.db.query_one("SELECT anh_hash FROM sanpham WHERE id=?", (product_id,))
+        return row[0] if row else None
+
+    def get_image(self, image_hash):
+        return ImageStore.get(self.db.conn, image_hash)
+
+    # images là cặp (ảnh xem, ảnh nhỏ) đã mã hóa, hoặc None nếu không có ảnh
+    @write_method
+    def insert(self, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images=None):
+        with self.db.transaction() as cursor:
+            image_hash, thumbnail_hash = (ImageStore.put(cursor, blob) for blob in images) if images else (None, None)
+            cursor.execute('''INSERT INTO sanpham
+                           (ma_sp, ten_sp, anh_hash, anh_nho_hash, gia_nhap, gia_ban, so_luong)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           (ma_sp, ten_sp, image_hash, thumbnail_hash, gia_nhap, gia_ban, so_luong))
+            return cursor.lastrowid
+
+    @write_method
+    def update(self, product_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images=None):
+        with self.db.transaction() as cursor:
+            cursor.execute('''UPDATE sanpham SET
+                           ma_sp=?, ten_sp=?, gia_nhap=?, gia_ban=?, so_luong=?
+                           WHERE id=?''',
+                           (ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, product_id))
+            if not images:
+                return
+            old_hashes = cursor.execute("SELECT anh_hash, anh_nho_hash FROM sanpham WHERE id=?",
+                                        (product_id,)).fetchone()
+            if ImageStore.hash_blob(images[0]) != old_hashes[0]:
+                new_hashes = [ImageStore.put(cursor, blob) for blob in images]
+                cursor.execute("UPDATE sanpham SET anh_hash=?, anh_nho_hash=? WHERE id=?", (*new_hashes, product_id))
+                for old_hash in old_hashes:
+                    ImageStore.release(cursor, old_hash)
+
+    def delete(self, product_id):
+        self.delete_many([product_id])
+
+    # Các thao tác hàng loạt chạy executemany trong một giao dịch
+    # Sản phẩm còn nằm trong đơn chưa giao/chưa hủy thì không được xóa (đơn đó còn giữ và sẽ trả hàng vào kho)
+    @write_method
+    def delete_many(self, product_ids):
+        with self.db.transaction() as cursor:
+            rows = fetch_by_ids(cursor, "sanpham", ("id", "ma_sp", "anh_hash", "anh_nho_hash"), product_ids)
+            in_use = []
+            for product_id, ma_sp, _, _ in rows:
+                order = cursor.execute("SELECT k.id FROM chitiet_donhang c JOIN khachhang k ON k.id = c.don_hang_id "
+                                       "WHERE c.san_pham_id=? AND k.trang_thai NOT IN (?, ?) LIMIT 1",
+                                       (product_id, OrderRepository.CANCELLED, OrderRepository.DELIVERED)).fetchone()
+                if order is not None:
+                    in_use.append(f"{ma_sp} (đơn {order[0]})")
+            if in_use:
+                raise ValueError(f"Không thể xóa sản phẩm đang có trong đơn hàng chưa giao: {', '.join(in_use)}")
+            cursor.executemany("DELETE FROM sanpham WHERE id=?", [(product_id,) for product_id in product_ids])
+            for image_hash in {image_hash for row in rows for image_hash in row[2:]}:
+                ImageStore.release(cursor, image_hash)
+
+    # Tăng/giảm giá bán theo phần trăm, làm tròn tới đồng
+    @write_method
+    def adjust_prices(self, product_ids, percent):
+        factor = 1 + percent / 100
+        with self.db.transaction() as cursor:
+            cursor.executemany("UPDATE sanpham SET gia_ban = max(round(coalesce(gia_ban, 0) * ?), 0) WHERE id=?",
+                               [(factor, product_id) for product_id in product_ids])
+
+    @write_method
+    def adjust_quantities(self, product_ids, delta):
+        with self.db.transaction() as cursor:
+            cursor.executemany("UPDATE sanpham SET so_luong = max(coalesce(so_luong, 0) + ?, 0) WHERE id=?",
+                               [(delta, product_id) for product_id in product_ids])
+
+class OutOfStockError(ValueError):
+    pass
+
+# Trừ/hoàn tồn kho theo chi tiết đơn; items là [(san_pham_id, so_luong, don_gia)]
+class Stock:
+    @staticmethod
+    def merge(items):
+        quantities = {}
+        for product_id, quantity, _ in items:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
+    # UPDATE có điều kiện so_luong >= ? là bước kiểm tra lạc quan: nếu người khác vừa bán mất hàng
+    # thì câu lệnh không khớp dòng nào, ta báo lỗi và cả giao dịch bị hủy
+    # existing: id sản phẩm đã có trong đơn từ trước; sản phẩm đó đã bị xóa thì không còn kho để trừ nên bỏ qua
+    @staticmethod
+    def take(cursor, items, existing=()):
+        for product_id, quantity in Stock.merge(items).items():
+            cursor.execute("UPDATE sanpham SET so_luong = so_luong - ? WHERE id=? AND so_luong >= ?",
+                           (quantity, product_id, quantity))
+            if cursor.rowcount == 1:
+                continue
+            row = cursor.execute("SELECT ma_sp, so_luong FROM sanpham WHERE id=?", (product_id,)).fetchone()
+            if row is None:
+                if product_id in existing:
+                    continue
+                raise OutOfStockError(f"Sản phẩm (id {product_id}) không còn tồn tại!")
+            raise OutOfStockError(f"Sản phẩm {row[0]} chỉ còn {row[1] or 0}, không đủ {quantity}!")
+
+    @staticmethod
+    def restore(cursor, items):
+        cursor.executemany("UPDATE sanpham SET so_luong = so_luong + ? WHERE id=?",
+                           [(quantity, product_id) for product_id, quantity in Stock.merge(items).items()])
+
+class OrderRepository:
+    COLUMNS = ("id", "ten_kh", "danh_muc", "ngay_dat", "ngay_giao", "file_sp",
+               "tong_tien", "da_coc", "con_thieu", "trang_thai")
+    # Đơn đã hủy không giữ hàng; xóa đơn chưa giao thì hoàn lại hàng vào kho
+    CANCELLED = "đã hủy"
+    DELIVERED = "đã giao"
+
+    def __init__(self, database=db):
+        self.db = database
+
+    # Cột được phép sắp xếp; mỗi cột đều có chỉ mục nên ORDER BY không cần sắp xếp tạm
+    SORT_COLUMNS = ("id", "ten_kh", "danh_muc", "ngay_dat", "ngay_giao", "tong_tien", "da_coc",
+                    "con_thieu", "trang_thai")
+
+    # Lọc và sắp xếp trên SQLite; ngày dạng ISO, số tiền còn thiếu là số (không phải chuỗi hiển thị)
+    def list_query(self, order_by="id", descending=False, trang_thai=None, date_from=None, date_to=None,
+                   min_due=None, max_due=None):
+        if order_by not in self.SORT_COLUMNS:
+            raise ValueError(f"Không thể sắp xếp theo cột {order_by}")
+        conditions = []
+        params = []
+        for condition, value in (("trang_thai = ?", trang_thai), ("ngay_dat >= ?", date_from),
+                                 ("ngay_dat <= ?", date_to), ("con_thieu >= ?", min_due),
+                                 ("con_thieu <= ?", max_due)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        sql = ("SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, "
+               "tong_tien, da_coc, con_thieu, trang_thai FROM khachhang")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = "DESC" if descending else "ASC"
+        sql += f" ORDER BY {order_by} {direction}" + (f", id {direction}" if order_by != "id" else "")
+        return sql, params
+
+    def list(self, *filters):
+        return self.db.query(*self.list_query(*filters))
+
+    # Như list() nhưng trả về từng đợt size dòng
+    def stream(self, *filters, size=1000):
+        return self.db.query_chunks(*self.list_query(*filters), size=size)
+
+    def search(self, query, limit=500):
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+        return self.db.query("SELECT k.id, k.ten_kh, k.danh_muc, k.ngay_dat, k.ngay_giao, k.file_sp, "
+                             "k.tong_tien, k.da_coc, k.con_thieu, k.trang_thai "
+                             "FROM (SELECT rowid, bm25(khachhang_fts, 2.0, 1.0) AS score FROM khachhang_fts "
+                             "WHERE khachhang_fts MATCH ? ORDER BY rowid DESC LIMIT ?) f "
+                             "JOIN khachhang k ON k.id = f.rowid ORDER BY f.score LIMIT ?",
+                             (match_query, limit * RANK_CANDIDATE_FACTOR, limit))
+
+    def get(self, order_id):
+        return self.db.query_one("SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, "
+                                 "tong_tien, da_coc, con_thieu, trang_thai FROM khachhang WHERE id=?", (order_id,))
+
+    def get_many(self, order_ids):
+        return fetch_by_ids(self.db.conn, "khachhang", self.COLUMNS, order_ids)
+
+    # Mỗi dòng: (san_pham_id, ma_sp, ten_sp, so_luong, don_gia)
+    def get_items(self, order_id):
+        return self.db.query("SELECT c.san_pham_id, s.ma_sp, s.ten_sp, c.so_luong, c.don_gia "
+                             "FROM chitiet_donhang c LEFT JOIN sanpham s ON s.id = c.san_pham_id "
+                             "WHERE c.don_hang_id=? ORDER BY c.id", (order_id,))
+
+    @staticmethod
+    def read_items(cursor, order_id):
+        return cursor.execute("SELECT san_pham_id, so_luong, don_gia FROM chitiet_donhang WHERE don_hang_id=?",
+                              (order_id,)).fetchall()
+
+    @staticmethod
+    def write_items(cursor, order_id, items):
+        cursor.executemany("INSERT INTO chitiet_donhang (don_hang_id, san_pham_id, so_luong, don_gia) "
+                           "VALUES (?, ?, ?, ?)", [(order_id, *item) for item in items])
+
+    # items là [(san_pham_id, so_luong, don_gia)]; đơn có chi tiết thì tong_tien do trigger tính từ chi tiết
+    @write_method
+    def insert(self, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai, items=()):
+        with self.db.transaction() as cursor:
+            cursor.execute('''INSERT INTO khachhang
+                           (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai))
+            order_id = cursor.lastrowid
+            if items:
+                if trang_thai != self.CANCELLED:
+                    Stock.take(cursor, items)
+                self.write_items(cursor, order_id, items)
+            return order_id
+
+    # items=None giữ nguyên chi tiết; một danh sách (kể cả rỗng) thay thế toàn bộ chi tiết cũ
+    @write_method
+    def update(self, order_id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai,
+               items=None):
+        with self.db.transaction() as cursor:
+            row = cursor.execute("SELECT trang_thai FROM khachhang WHERE id=?", (order_id,)).fetchone()
+            held_before = row is not None and row[0] != self.CANCELLED
+            held_after = trang_thai != self.CANCELLED
+            if items is not None or held_before != held_after:
+                old_items = self.read_items(cursor, order_id)
+                if held_before:
+                    Stock.restore(cursor, old_items)
+                if items is not None:
+                    cursor.execute("DELETE FROM chitiet_donhang WHERE don_hang_id=?", (order_id,))
+                    self.write_items(cursor, order_id, items)
+                if held_after:
+                    Stock.take(cursor, old_items if items is None else items,
+                               {product_id for product_id, _, _ in old_items})
+            cursor.execute('''UPDATE khachhang SET
+                           ten_kh=?, danh_muc=?, ngay_dat=?, ngay_giao=?, file_sp=?,
+                           tong_tien=CASE WHEN EXISTS (SELECT 1 FROM chitiet_donhang WHERE don_hang_id=?)
+                                     THEN tong_tien ELSE ? END,
+                           da_coc=?, trang_thai=?
+                           WHERE id=?''',
+                           (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, order_id,
+                            tong_tien, da_coc, trang_thai, order_id))
+
+    def due_between(self, start_date, end_date, trang_thai):
+        return self.db.query("SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, "
+                             "tong_tien, da_coc, tong_tien - da_coc, trang_thai FROM khachhang "
+                             "WHERE trang_thai=? AND ngay_giao BETWEEN ? AND ? ORDER BY ngay_giao",
+                             (trang_thai, start_date, end_date))
+
+    def set_status(self, order_id, trang_thai):
+        self.set_status_many([order_id], trang_thai)
+
+    # Hủy đơn thì hoàn hàng; khôi phục đơn đã hủy thì trừ lại (có thể báo hết hàng)
+    @write_method
+    def set_status_many(self, order_ids, trang_thai):
+        with self.db.transaction() as cursor:
+            for order_id, old_status in fetch_by_ids(cursor, "khachhang", ("id", "trang_thai"), order_ids):
+                if (old_status == self.CANCELLED) == (trang_thai == self.CANCELLED):
+                    continue
+                items = self.read_items(cursor, order_id)
+                if trang_thai == self.CANCELLED:
+                    Stock.restore(cursor, items)
+                else:
+                    Stock.take(cursor, items, {product_id for product_id, _, _ in items})
+            cursor.executemany("UPDATE khachhang SET trang_thai=? WHERE id=?",
+                               [(trang_thai, order_id) for order_id in order_ids])
+
+    def delete(self, order_id):
+        self.delete_many([order_id])
+
+    @write_method
+    def delete_many(self, order_ids):
+        with self.db.transaction() as cursor:
+            for order_id, status in fetch_by_ids(cursor, "khachhang", ("id", "trang_thai"), order_ids):
+                if status not in (self.CANCELLED, self.DELIVERED):
+                    Stock.restore(cursor, self.read_items(cursor, order_id))
+            cursor.executemany("DELETE FROM chitiet_donhang WHERE don_hang_id=?", [(order_id,) for order_id in order_ids])
+            cursor.executemany("DELETE FROM khachhang WHERE id=?", [(order_id,) for order_id in order_ids])
+
+class ReportRepository:
+    def __init__(self, database=db):
+        self.db = database
+
+    # Mỗi dòng: (khoa, so_don, tong_tien, da_coc, con_thieu); start/end giới hạn khoảng khóa (vd. ngày)
+    def summary(self, group, start=None, end=None):
+        sql = ("SELECT khoa, so_don, tong_tien, da_coc, tong_tien - da_coc FROM baocao_tonghop "
+               "WHERE nhom=? AND so_don > 0")
+        params = [group]
+        if start is not None:
+            sql += " AND khoa >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND khoa <= ?"
+            params.append(end)
+        return self.db.query(sql + " ORDER BY khoa", params)
+
+    # Tổng toàn bộ = cộng các nhóm trạng thái (chỉ vài dòng)
+    def totals(self):
+        return self.db.query_one("SELECT total(so_don), total(tong_tien), total(da_coc), "
+                                 "total(tong_tien) - total(da_coc) FROM baocao_tonghop WHERE nhom='trang_thai'")
+
+class ChangeLog:
+    def __init__(self, database=db):
+        self.db = database
+
+    def version(self, table):
+        row = self.db.query_one("SELECT phien_ban FROM thaydoi WHERE bang=? ORDER BY phien_ban DESC LIMIT 1",
+                                (table,))
+        return row[0] if row else 0
+
+    # (phiên bản mới, id đã thêm/sửa, id đã xóa); quá limit dòng thì trả về None thay cho hai danh sách để nạp lại
+    def since(self, table, version, limit=1000):
+        rows = self.db.query("SELECT ban_ghi_id, phien_ban, da_xoa FROM thaydoi WHERE bang=? AND phien_ban > ? "
+                             "ORDER BY phien_ban LIMIT ?", (table, version, limit + 1))
+        if len(rows) > limit:
+            return self.version(table), None, None
+        if not rows:
+            return version, [], []
+        return (rows[-1][1], [row_id for row_id, _, deleted in rows if not deleted],
+                [row_id for row_id, _, deleted in rows if deleted])
@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import threading
+import time
+
+from backend import RemoteBackend
+
+# Mỗi thao tác là một lần gọi API; ghi dùng set_status với trạng thái hiện tại nên không làm đổi dữ liệu
+def read_search(backend, rng, ids):
+    backend.products.search(rng.choice(("a", "sp", "ao", "1", "2")), 50)
+
+def read_get(backend, rng, ids):
+    if ids["products"]:
+        backend.products.get(rng.choice(ids["products"]))
+
+def read_page(backend, rng, ids):
+    backend.products.pager(200, rng.choice(("id", "ten_sp", "gia_ban"))).page_after(None)
+
+def read_orders(backend, rng, ids):
+    if ids["orders"]:
+        backend.orders.get_many(rng.sample(ids["orders"], min(20, len(ids["orders"]))))
+
+def write_status(backend, rng, ids):
+    if ids["orders"]:
+        order = backend.orders.get(rng.choice(ids["orders"]))
+        if order is not None:
+            backend.orders.set_status(order[0], order[-1])
+
+OPERATIONS = (
+    ("search", read_search, 3),
+    ("get", read_get, 4),
+    ("page", read_page, 2),
+    ("orders", read_orders, 2),
+    ("write", write_status, 1),
+)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run(url, clients, duration, seed=0):
+    backend = RemoteBackend(url)
+    first_page, _ = backend.products.pager(500).page_after(None)
+    ids = {
+        "products": [row[0] for row in first_page],
+        "orders": [row[0] for row in backend.orders.list()[:500]],
+    }
+    names = [name for name, _, _ in OPERATIONS]
+    weights = [weight for _, _, weight in OPERATIONS]
+    functions = {name: fn for name, fn, _ in OPERATIONS}
+    latencies = {name: [] for name in names}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        local = {name: [] for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                functions[name](backend, rng, ids)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{name}: {e}")
+                continue
+            local[name].append((time.perf_counter() - start) * 1000)
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    summary = lambda values: {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+    }
+    return {
+        "url": url,
+        "clients": clients,
+        "seconds": round(elapsed, 2),
+        "requests": len(all_latencies),
+        "rps": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": summary(all_latencies),
+        "operations": {name: summary(values) for name, values in latencies.items()},
+        "errors": len(errors),
+        "error_samples": errors[:10],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo tải đồng thời lên máy chủ server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    result = run(args.url, args.clients, args.seconds, args.seed)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
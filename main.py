@@ -1,88 +1,594 @@
 
+# Mốc tính thời gian khởi động cho --startup-check, đặt trước mọi import khác
+import time
+STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from tkcalendar import DateEntry
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import sqlite3
-from PIL import Image, ImageTk
 import os
+import sys
+import json
 from io import BytesIO
-from datetime import datetime
-import subprocess
-import platform
+from datetime import datetime, date, timedelta
+from collections import OrderedDict, deque
+from database import db, fold_text, search_tokens, matches_query, to_iso_date, to_display_date
+from backend import LocalBackend, RemoteBackend
+from worker import BackgroundWorker
+from profiling import profiler
+from models import ProductRow, OrderRow
+from csv_io import import_csv, export_csv, CsvImportError
+
+# QLBH_SERVER=http://máy-chủ:8765 để nhiều máy cùng dùng một CSDL qua server.py; mặc định mở file CSDL trực tiếp
+# (file trên ổ mạng thì không dùng WAL, xem database.JOURNAL_MODE)
+# backend.init() (kiểm tra lược đồ CSDL) chạy sau khi cửa sổ chính đã hiện, xem cuối file
+backend = RemoteBackend(os.environ["QLBH_SERVER"]) if os.environ.get("QLBH_SERVER") else LocalBackend(db)
 
-# Khởi tạo CSDL
-def init_db():
-    with sqlite3.connect("quanlybanhang.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS sanpham (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        ma_sp TEXT UNIQUE,
-                        ten_sp TEXT,
-                        anh_sp BLOB,
-                        gia_nhap REAL,
-                        gia_ban REAL,
-                        so_luong INTEGER)''')
-        cursor.execute('''CREATE TABLE IF NOT EXISTS khachhang (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        ten_kh TEXT,
-                        danh_muc TEXT,
-                        ngay_dat TEXT,
-                        ngay_giao TEXT,
-                        file_sp TEXT,
-                        tong_tien REAL,
-                        da_coc REAL,
-                        con_thieu REAL GENERATED ALWAYS AS (tong_tien - da_coc) VIRTUAL,
-                        trang_thai TEXT)''')
-        conn.commit()
+# Thời gian tối đa (ms) từ lúc nạp main.py tới khi cửa sổ chính vẽ xong, kiểm tra bằng "python main.py --startup-check"
+STARTUP_BUDGET_MS = float(os.environ.get("QLBH_STARTUP_BUDGET_MS", "1500"))
+# Các thư viện nặng chỉ được nạp khi lần đầu dùng tới (ảnh, chọn ngày, phân tích tồn kho)
+LAZY_MODULES = ("PIL", "tkcalendar", "numpy", "http.client")
 
-init_db()
+# tkcalendar chỉ được nạp khi lần đầu mở màn hình hoặc hộp thoại có ô chọn ngày
+def date_entry(parent, **kwargs):
+    from tkcalendar import DateEntry
+    return DateEntry(parent, date_pattern='dd/mm/yyyy', **kwargs)
 
 class ImageManager:
+    # Ảnh sản phẩm được lưu hai bản: PREVIEW_SIZE để xem ảnh, THUMBNAIL_SIZE cho ô xem trước trong hộp thoại
+    # IMAGE_FORMAT là "WEBP" nếu Pillow hỗ trợ, ngược lại "JPEG"; xác định khi mã hóa ảnh lần đầu (image_format)
+    IMAGE_FORMAT = None
+    IMAGE_QUALITY = 80
+    PREVIEW_SIZE = (800, 800)
+    THUMBNAIL_SIZE = (150, 150)
+    MAX_FILE_BYTES = 50 * 1024 * 1024
+    MAX_PIXELS = 100_000_000
+    
+    # PIL chỉ được nạp khi lần đầu xử lý ảnh
     @staticmethod
-    def resize_image(image_path, max_size=(100, 100)):
-        try:
-            img = Image.open(image_path)
-            img.thumbnail(max_size)
-            return ImageTk.PhotoImage(img)
-        except Exception as e:
-            print(f"Error resizing image: {e}")
-            return None
+    def image_format():
+        if ImageManager.IMAGE_FORMAT is None:
+            from PIL import features
+            ImageManager.IMAGE_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+        return ImageManager.IMAGE_FORMAT
     
+    # Các hàm open_image, ingest, decode_* chỉ dùng PIL nên chạy được trên luồng nền; PhotoImage phải tạo trên luồng Tk
     @staticmethod
-    def image_to_blob(image_path):
-        try:
-            img = Image.open(image_path)
-            img.thumbnail((200, 200))
-            with BytesIO() as output:
-                img.save(output, format="PNG")
-                return output.getvalue()
-        except Exception as e:
-            print(f"Error converting image to blob: {e}")
-            return None
+    def open_image(image_path, max_size):
+        from PIL import Image, ImageOps
+        if os.path.getsize(image_path) > ImageManager.MAX_FILE_BYTES:
+            raise ValueError(f"File ảnh lớn hơn {ImageManager.MAX_FILE_BYTES // (1024 * 1024)} MB!")
+        img = Image.open(image_path)
+        if img.width * img.height > ImageManager.MAX_PIXELS:
+            raise ValueError(f"Ảnh quá lớn ({img.width}x{img.height} điểm ảnh)!")
+        # Với JPEG, draft giải mã thẳng ở tỉ lệ 1/2, 1/4 hoặc 1/8 thay vì cả ảnh gốc
+        img.draft(None, max_size)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(max_size, reducing_gap=3.0)
+        return img
+    
+    @staticmethod
+    def encode(img):
+        from PIL import Image
+        image_format = ImageManager.image_format()
+        if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+            img = img.convert("RGBA")
+            # JPEG không có kênh trong suốt nên ghép lên nền trắng
+            if image_format == "JPEG":
+                background = Image.new("RGB", img.size, "white")
+                background.paste(img, mask=img)
+                img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        with BytesIO() as output:
+            img.save(output, format=image_format, quality=ImageManager.IMAGE_QUALITY)
+            return output.getvalue()
+    
+    # Giải mã một lần ở kích thước xem ảnh rồi thu nhỏ tiếp thành ảnh nhỏ; trả về (ảnh xem, ảnh nhỏ)
+    @staticmethod
+    def ingest(image_path):
+        img = ImageManager.open_image(image_path, ImageManager.PREVIEW_SIZE)
+        thumbnail = img.copy()
+        thumbnail.thumbnail(ImageManager.THUMBNAIL_SIZE, reducing_gap=3.0)
+        return ImageManager.encode(img), ImageManager.encode(thumbnail)
     
     @staticmethod
-    def blob_to_image(blob_data):
-        if blob_data is None or isinstance(blob_data, str):
+    def decode_blob(blob_data, max_size=None):
+        from PIL import Image
+        if not blob_data or isinstance(blob_data, str):
+            return None
+        img = Image.open(BytesIO(blob_data))
+        img.load()
+        if max_size:
+            img.thumbnail(max_size)
+        return img
+
+class ImageCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, max_size=None):
+        entry = self.entries.get((key, max_size))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end((key, max_size))
+        return entry[1]
+    
+    def put(self, key, img, max_size=None):
+        old = self.entries.pop((key, max_size), None)
+        if old is not None:
+            self.current_bytes -= old[2]
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(img)
+        # PIL giữ ảnh theo số kênh màu, PhotoImage của Tk luôn là RGBA
+        size = img.width * img.height * (len(img.getbands()) + 4)
+        self.entries[(key, max_size)] = (img, photo, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+        return photo
+    
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.current_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+image_cache = ImageCache()
+
+# Ánh xạ id -> dòng Treeview (iid chính là id) để chỉ chèn, sửa, xóa những dòng thực sự thay đổi
+class TreeSync:
+    # format: chuyển dòng (vd. ProductRow) thành giá trị hiển thị; chỉ gọi khi dòng được chèn hoặc thay đổi
+    def __init__(self, tree, format=None):
+        self.tree = tree
+        self.format = format
+        self.values = {}
+    
+    def display(self, row):
+        return self.format(row) if self.format else row
+    
+    def insert(self, index, row_id, row):
+        iid = str(row_id)
+        self.tree.insert("", index, iid=iid, values=self.display(row))
+        self.values[iid] = row
+        return iid
+    
+    def upsert(self, row_id, row, index="end"):
+        iid = str(row_id)
+        if iid not in self.values:
+            return self.insert(index, row_id, row)
+        if self.values[iid] != row:
+            self.tree.item(iid, values=self.display(row))
+            self.values[iid] = row
+        return iid
+    
+    def remove(self, *row_ids):
+        iids = [iid for iid in map(str, row_ids) if iid in self.values]
+        if iids:
+            self.tree.delete(*iids)
+        for iid in iids:
+            del self.values[iid]
+    
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self.values.clear()
+    
+    # Số dòng apply(rows) sẽ chèn/sửa/xóa trên Treeview; None nếu phải đổi thứ tự các dòng được giữ lại
+    def diff_size(self, rows):
+        new_iids = [str(row_id) for row_id, _ in rows]
+        new_set = set(new_iids)
+        remaining = [iid for iid in self.tree.get_children() if iid in new_set]
+        if remaining != [iid for iid in new_iids if iid in self.values]:
             return None
+        changed = sum(1 for iid, (_, row) in zip(new_iids, rows) if self.values.get(iid) != row)
+        return len(self.values) - len(remaining) + changed
+    
+    # Làm mới toàn bộ: so sánh với các dòng đang hiển thị và chỉ áp dụng phần khác nhau
+    def apply(self, rows):
+        new_iids = [str(row_id) for row_id, _ in rows]
+        new_set = set(new_iids)
+        self.remove(*[iid for iid in self.tree.get_children() if iid not in new_set])
+        
+        in_order = list(self.tree.get_children()) == [iid for iid in new_iids if iid in self.values]
+        for index, (row_id, row) in enumerate(rows):
+            self.upsert(row_id, row, index if in_order else "end")
+        if not in_order:
+            for index, iid in enumerate(new_iids):
+                self.tree.move(iid, "", index)
+
+# Số tiền người dùng nhập để lọc; chuỗi rỗng nghĩa là không giới hạn
+def parse_amount(text):
+    text = text.strip().replace(",", "").replace("đ", "")
+    return float(text) if text else None
+
+# Tiêu đề cột bấm được: bấm lần nữa để đảo chiều; việc sắp xếp do on_sort(cột CSDL, giảm dần) đẩy xuống SQLite
+class SortableHeadings:
+    def __init__(self, tree, columns, sort_columns, on_sort, column="id", descending=False):
+        self.tree = tree
+        self.columns = columns
+        self.sort_columns = sort_columns
+        self.on_sort = on_sort
+        self.column = column
+        self.descending = descending
+        for col in columns:
+            if col in sort_columns:
+                self.tree.heading(col, text=col, command=lambda c=col: self.click(c))
+            else:
+                self.tree.heading(col, text=col)
+        self.refresh()
+    
+    def click(self, title):
+        column = self.sort_columns[title]
+        self.descending = not self.descending if column == self.column else False
+        self.column = column
+        self.refresh()
+        self.on_sort(self.column, self.descending)
+    
+    def refresh(self):
+        for col in self.columns:
+            arrow = ""
+            if self.sort_columns.get(col) == self.column:
+                arrow = " ▼" if self.descending else " ▲"
+            self.tree.heading(col, text=col + arrow)
+
+# Tìm kiếm khi gõ: chờ người dùng ngừng gõ, bỏ kết quả cũ và lọc lại trên kết quả trước nếu từ khóa chỉ gõ thêm
+class LiveSearch:
+    def __init__(self, root, worker, search_var, run_query, show_results, on_clear, row_texts,
+                 delay_ms=250, limit=500):
+        self.root = root
+        self.worker = worker
+        self.search_var = search_var
+        self.run_query = run_query
+        self.show_results = show_results
+        self.on_clear = on_clear
+        self.row_texts = row_texts
+        self.delay_ms = delay_ms
+        self.limit = limit
+        self.after_id = None
+        self.generation = 0
+        # Báo cho người dùng khi kết quả bị cắt ở limit dòng (chỉ còn các bản ghi mới nhất)
+        self.notice_var = tk.StringVar(master=root, value="")
+        self.reset_cache()
+        self.search_var.trace_add("write", self.on_change)
+    
+    def reset_cache(self):
+        self.last_query = None
+        self.last_rows = None
+        self.last_complete = False
+    
+    def on_change(self, *args):
+        self.cancel_pending()
+        self.generation += 1
+        self.after_id = self.root.after(self.delay_ms, self.run, self.generation)
+    
+    def cancel_pending(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+    
+    def run_now(self):
+        self.cancel_pending()
+        self.generation += 1
+        self.run(self.generation)
+    
+    def clear(self):
+        self.search_var.set("")
+        self.run_now()
+    
+    def run(self, generation):
+        self.after_id = None
+        query = fold_text(self.search_var.get().strip())
+        if not query:
+            self.reset_cache()
+            self.notice_var.set("")
+            self.on_clear()
+            return
+        
+        if self.last_rows is not None and self.last_complete and query.startswith(self.last_query):
+            tokens = search_tokens(query)
+            rows = [row for row in self.last_rows if matches_query(tokens, self.row_texts(row))]
+            self.finish(generation, query, rows)
+        else:
+            self.worker.submit(self.run_query, query, self.limit,
+                               on_done=lambda rows: self.finish(generation, query, rows))
+    
+    # Dòng vừa bị sửa (ChangeFeed) còn khớp từ khóa đang tìm không; cùng quy tắc với MATCH
+    def matches(self, row):
+        return matches_query(search_tokens(self.search_var.get()), self.row_texts(row))
+    
+    def finish(self, generation, query, rows):
+        if generation != self.generation:
+            return
+        
+        self.last_query = query
+        self.last_rows = rows
+        self.last_complete = len(rows) < self.limit
+        self.notice_var.set("" if self.last_complete else
+                            f"Chỉ hiện {self.limit} kết quả mới nhất, hãy gõ thêm từ khóa để thu hẹp")
+        self.show_results(rows)
+
+# Theo dõi bảng thaydoi: mỗi POLL_MS đọc các dòng có phiên bản mới (truy vấn theo chỉ mục), chỉ khi màn hình còn mở
+# on_ready (lần nạp đầu) chỉ chạy sau khi đã đọc phiên bản bắt đầu: nạp song song thì thay đổi ghi xong giữa lúc nạp
+# và lúc đọc phiên bản sẽ bị mất; nạp sau thì cùng lắm nhận lại một thay đổi đã có
+class ChangeFeed:
+    POLL_MS = 2000
+    MAX_CHANGES = 1000
+    
+    def __init__(self, root, worker, widget, table, on_changes, on_reload, on_ready=None):
+        self.root = root
+        self.worker = worker
+        self.widget = widget
+        self.table = table
+        self.on_changes = on_changes
+        self.on_reload = on_reload
+        self.on_ready = on_ready
+        self.version = None
+        self.pending = False
+        self.worker.submit(backend.changes.version, table, on_done=self.start, on_error=self.on_start_error,
+                           background=True)
+    
+    def start(self, version):
+        self.version = version
+        if self.on_ready is not None:
+            self.on_ready()
+        self.root.after(self.POLL_MS, self.poll)
+    
+    # Không đọc được phiên bản thì vẫn nạp dữ liệu và báo lỗi như khi nạp thất bại
+    def on_start_error(self, error):
+        self.worker.show_error(error)
+        if self.on_ready is not None:
+            self.on_ready()
+    
+    def poll(self):
+        if not self.widget.winfo_exists():
+            return
+        # Màn hình đang ẩn (Navigator) thì không đọc; thay đổi được lấy một lượt khi quay lại (refresh)
+        if self.widget.winfo_ismapped():
+            self.refresh()
+        self.root.after(self.POLL_MS, self.poll)
+    
+    def refresh(self):
+        if self.pending or self.version is None:
+            return
+        self.pending = True
+        self.worker.submit(backend.changes.since, self.table, self.version, self.MAX_CHANGES,
+                           on_done=self.apply, on_error=self.on_poll_error, background=True)
+    
+    # Lỗi đọc (vd. máy chủ tạm mất kết nối) chỉ bỏ qua lượt này, lượt sau thử lại
+    def on_poll_error(self, error):
+        self.pending = False
+    
+    def apply(self, result):
+        self.pending = False
+        version, changed_ids, deleted_ids = result
+        if version == self.version or not self.widget.winfo_exists():
+            return
+        self.version = version
+        if changed_ids is None:
+            self.on_reload()
+        else:
+            self.on_changes(changed_ids, deleted_ids)
+
+# Mỗi màn hình được dựng một lần (screen.frame) rồi chỉ ẩn/hiện; quay lại màn hình cũ gọi on_show() để làm mới
+# phần thay đổi, lưới giữ nguyên vị trí cuộn, dòng đang chọn và dữ liệu đã nạp
+class Navigator:
+    def __init__(self, root):
+        self.root = root
+        self.screens = {}
+        self.current = None
+    
+    def register(self, name, screen):
+        self.screens[name] = screen
+    
+    def show(self, name, factory=None):
+        screen = self.screens.get(name)
+        created = screen is None
+        if created:
+            screen = self.screens[name] = factory()
+        if screen is self.current:
+            return screen
+        if self.current is not None:
+            self.current.frame.pack_forget()
+        screen.frame.pack(fill="both", expand=True)
+        self.current = screen
+        if not created and hasattr(screen, "on_show"):
+            screen.on_show()
+        return screen
+
+# Hộp thoại được dựng một lần (build) rồi ẩn khi đóng, mở lại chỉ cần đặt lại giá trị các ô;
+# session tăng mỗi lần mở để bỏ qua kết quả đến muộn của lần mở trước
+class PooledDialog:
+    def __init__(self, root, build):
+        self.root = root
+        self.build = build
+        self.window = None
+        self.session = 0
+    
+    def open(self, title):
+        if self.window is None or not self.window.winfo_exists():
+            self.window = tk.Toplevel(self.root)
+            self.window.protocol("WM_DELETE_WINDOW", self.close)
+            self.build(self.window)
+        else:
+            self.window.deiconify()
+        self.session += 1
+        self.window.title(title)
+        self.window.lift()
+        self.window.grab_set()
+        return self.session
+    
+    def is_open(self, session):
+        return (session == self.session and self.window is not None and self.window.winfo_exists()
+                and self.window.state() != "withdrawn")
+    
+    def close(self, session=None):
+        if session is not None and session != self.session:
+            return
+        if self.window is not None and self.window.winfo_exists():
+            self.window.grab_release()
+            self.window.withdraw()
+
+# Bảng chi tiết đơn trong hộp thoại đơn hàng; khi có chi tiết thì tổng tiền được tính từ các dòng
+class OrderItemsEditor:
+    def __init__(self, parent, worker, product_repo, tong_tien, tong_tien_entry, row):
+        self.worker = worker
+        self.product_repo = product_repo
+        self.tong_tien = tong_tien
+        self.tong_tien_entry = tong_tien_entry
+        self.items = []
+        self.saved_items = None
+        self.loaded = True
+        
+        frame = tk.LabelFrame(parent, text="Chi tiết đơn hàng")
+        frame.grid(row=row, column=0, columnspan=3, padx=5, pady=5, sticky="we")
+        
+        entry_bar = tk.Frame(frame)
+        entry_bar.pack(fill="x")
+        tk.Label(entry_bar, text="Mã SP:").pack(side="left", padx=5)
+        self.ma_sp = tk.StringVar()
+        tk.Entry(entry_bar, textvariable=self.ma_sp, width=12).pack(side="left", padx=5)
+        tk.Label(entry_bar, text="SL:").pack(side="left", padx=5)
+        self.so_luong = tk.IntVar(value=1)
+        tk.Entry(entry_bar, textvariable=self.so_luong, width=5).pack(side="left", padx=5)
+        tk.Button(entry_bar, text="Thêm", command=self.add_item).pack(side="left", padx=5)
+        tk.Button(entry_bar, text="Xóa dòng", command=self.remove_item).pack(side="left", padx=5)
+        
+        columns = ("Mã SP", "Tên SP", "SL", "Đơn giá", "Thành tiền")
+        self.tree = ttk.Treeview(frame, columns=columns, show="headings", height=5)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=150 if col == "Tên SP" else 80)
+        self.tree.pack(fill="both", expand=True)
+    
+    def add_item(self):
+        ma_sp = self.ma_sp.get().strip()
         try:
-            return ImageTk.PhotoImage(Image.open(BytesIO(blob_data)))
-        except Exception as e:
-            print(f"Error converting blob to image: {e}")
+            so_luong = self.so_luong.get()
+        except tk.TclError:
+            so_luong = 0
+        if not ma_sp or so_luong <= 0:
+            messagebox.showerror("Lỗi", "Vui lòng nhập mã sản phẩm và số lượng lớn hơn 0!")
+            return
+        self.worker.submit(self.product_repo.get_by_code, ma_sp,
+                           on_done=lambda product: self.on_product_found(ma_sp, product, so_luong))
+    
+    def on_product_found(self, ma_sp, product, so_luong):
+        if not product:
+            messagebox.showerror("Lỗi", f"Không tìm thấy sản phẩm {ma_sp}!")
+            return
+        # Đơn giá lấy theo giá bán lúc thêm vào đơn
+        self.items.append([product[0], product[1], product[2], so_luong, product[5] or 0])
+        self.ma_sp.set("")
+        self.so_luong.set(1)
+        self.refresh()
+    
+    def remove_item(self):
+        for iid in sorted(map(int, self.tree.selection()), reverse=True):
+            del self.items[iid]
+        self.refresh()
+    
+    # Hộp thoại đơn hàng được dùng lại: xóa chi tiết của lần mở trước; đơn mới không có chi tiết cũ để so sánh
+    def reset(self):
+        self.ma_sp.set("")
+        self.so_luong.set(1)
+        self.set_items([])
+        self.saved_items = None
+    
+    # rows: [(san_pham_id, ma_sp, ten_sp, so_luong, don_gia)] từ OrderRepository.get_items
+    def set_items(self, rows):
+        self.items = [list(row) for row in rows]
+        self.saved_items = [(product_id, so_luong, don_gia) for product_id, _, _, so_luong, don_gia in rows]
+        self.loaded = True
+        self.refresh()
+    
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        for index, (_, ma_sp, ten_sp, so_luong, don_gia) in enumerate(self.items):
+            self.tree.insert("", "end", iid=str(index), values=(ma_sp or "", ten_sp or "", so_luong,
+                                                                f"{don_gia:,.0f}đ", f"{so_luong * don_gia:,.0f}đ"))
+        if self.items:
+            self.tong_tien.set(sum(so_luong * don_gia for _, _, _, so_luong, don_gia in self.items))
+            self.tong_tien_entry.config(state="readonly")
+        else:
+            self.tong_tien_entry.config(state="normal")
+    
+    # None: đang sửa đơn mà chi tiết chưa nạp xong hoặc không đổi nên giữ nguyên (không trả/trừ kho lại);
+    # danh sách: [(san_pham_id, so_luong, don_gia)], đơn mới luôn là danh sách (có thể rỗng)
+    def items_for_save(self):
+        if not self.loaded:
             return None
+        items = [(product_id, so_luong, don_gia) for product_id, _, _, so_luong, don_gia in self.items]
+        return None if items == self.saved_items else items
+
+# Nhập/xuất CSV trên luồng nền; tiến độ được đẩy về luồng Tk qua worker.call_soon
+class CsvTransfer:
+    def __init__(self, root, worker, table, on_imported):
+        self.root = root
+        self.worker = worker
+        self.table = table
+        self.on_imported = on_imported
+    
+    def report(self, count, fraction):
+        text = f"Đã xử lý {count:,} dòng" + (f" ({fraction:.0%})" if fraction is not None else "")
+        self.worker.call_soon(self.worker.status_var.set, text)
+    
+    def import_file(self):
+        path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        answer = messagebox.askyesnocancel("Nhập CSV", "Bỏ qua các dòng lỗi và tiếp tục nhập?\n"
+                                           "Chọn \"No\" để dừng ngay khi gặp dòng lỗi.")
+        if answer is None:
+            return
+        self.worker.submit(import_csv, backend.database, self.table, path, "skip" if answer else "abort", 5000, self.report,
+                           on_done=self.show_import_result, on_error=self.show_import_error)
+    
+    def show_import_result(self, result):
+        message = f"Đã nhập {result.imported:,} dòng, bỏ qua {result.skipped:,} dòng."
+        if result.errors:
+            message += "\n\n" + "\n".join(result.errors[:10])
+        messagebox.showinfo("Nhập CSV", message)
+        self.on_imported()
+    
+    def show_import_error(self, error):
+        if isinstance(error, CsvImportError):
+            messagebox.showerror("Lỗi", f"Đã dừng nhập CSV: {str(error)}")
+        else:
+            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(error)}")
+        self.on_imported()
+    
+    def export_file(self):
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        if not path:
+            return
+        self.worker.submit(export_csv, backend.database, self.table, path, 5000, self.report,
+                           on_done=lambda count: messagebox.showinfo("Xuất CSV", f"Đã xuất {count:,} dòng ra {path}"))
 
 class MainApp:
-    def __init__(self, root):
+    MAINTENANCE_DELAY_MS = 5 * 60 * 1000
+    MAINTENANCE_CHECK_MS = 60 * 60 * 1000
+    
+    def __init__(self, root, worker=None):
         self.root = root
+        self.worker = worker or BackgroundWorker(root)
         self.root.title("HỆ THỐNG QUẢN LÝ BÁN HÀNG")
         self.root.geometry("1280x720")
         self.root.state('zoomed')
+        self.navigator = Navigator(root)
+        self.diagnostics = None
+        self.maintenance = None
         self.setup_main_frame()
+        self.navigator.register("home", self)
+        self.navigator.show("home")
     
     def setup_main_frame(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
-        
-        main_frame = tk.Frame(self.root, bg="#f0f0f0")
+        self.frame = tk.Frame(self.root, bg="#f0f0f0")
+        main_frame = tk.Frame(self.frame, bg="#f0f0f0")
         main_frame.pack(fill="both", expand=True)
         
         tk.Label(main_frame, text="HỆ THỐNG QUẢN LÝ BÁN HÀNG", 
@@ -95,27 +601,81 @@ class MainApp:
                  font=("Arial", 14), command=self.open_product_manager, bg="#3498db", fg="black").grid(row=0, column=0, padx=20)
         tk.Button(btn_frame, text="QUẢN LÝ ĐƠN HÀNG", width=25, height=3,
                  font=("Arial", 14), command=self.open_order_manager, bg="#2ecc71", fg="black").grid(row=0, column=1, padx=20)
+        tk.Button(btn_frame, text="BÁO CÁO DOANH THU", width=25, height=3,
+                 font=("Arial", 14), command=self.open_report_manager, bg="#f1c40f", fg="black").grid(row=0, column=2, padx=20)
         tk.Button(btn_frame, text="THOÁT", width=25, height=3,
-                 font=("Arial", 14), command=self.root.quit, bg="#e74c3c", fg="black").grid(row=0, column=2, padx=20)
+                 font=("Arial", 14), command=self.root.quit, bg="#e74c3c", fg="black").grid(row=0, column=3, padx=20)
+        
+        tk.Button(main_frame, text="Chẩn đoán hiệu năng", command=self.open_diagnostics).pack(pady=10)
+        # Sao lưu/bảo trì chạy trên máy giữ file CSDL; khi dùng máy chủ thì chạy "maintenance.py" trên máy chủ
+        if not backend.remote:
+            tk.Button(main_frame, text="Sao lưu & bảo trì CSDL", command=self.open_maintenance).pack(pady=10)
+            self.root.after(self.MAINTENANCE_DELAY_MS, self.run_maintenance)
     
     def open_product_manager(self):
-        ProductManager(self.root)
+        self.navigator.show("products", lambda: ProductManager(self.root, self.worker, self.navigator))
     
     def open_order_manager(self):
-        OrderManager(self.root)
+        self.navigator.show("orders", lambda: OrderManager(self.root, self.worker, self.navigator))
+    
+    def open_report_manager(self):
+        self.navigator.show("reports", lambda: ReportManager(self.root, self.worker, self.navigator))
+    
+    def open_diagnostics(self):
+        if self.diagnostics is not None and self.diagnostics.window.winfo_exists():
+            self.diagnostics.window.deiconify()
+            self.diagnostics.window.lift()
+        else:
+            self.diagnostics = DiagnosticsWindow(self.root)
+    
+    def open_maintenance(self):
+        if self.maintenance is not None and self.maintenance.window.winfo_exists():
+            self.maintenance.window.deiconify()
+            self.maintenance.window.lift()
+            self.maintenance.refresh()
+        else:
+            self.maintenance = MaintenanceWindow(self.root, self.worker)
+    
+    # Sao lưu, thu hồi dung lượng và ANALYZE theo lịch (maintenance.SCHEDULE_HOURS); kiểm tra mỗi giờ
+    def run_maintenance(self):
+        from maintenance import run_scheduled
+        self.worker.submit(run_scheduled, backend.database, background=True)
+        self.root.after(self.MAINTENANCE_CHECK_MS, self.run_maintenance)
 
 class ProductManager:
-    def __init__(self, root):
+    PAGE_SIZE = 200
+    MAX_WINDOW_PAGES = 5
+    REPORT_TOP_N = 20
+    LOW_STOCK_THRESHOLD = 5
+    SORT_COLUMNS = {"ID": "id", "Mã SP": "ma_sp", "Tên SP": "ten_sp", "Giá nhập": "gia_nhap",
+                    "Giá bán": "gia_ban", "Số lượng": "so_luong"}
+    
+    def __init__(self, root, worker, navigator):
         self.root = root
-        self.image_references = []
+        self.worker = worker
+        self.navigator = navigator
+        self.repo = backend.products
+        self.view_token = 0
+        self.pager = None
+        self.sort_column = "id"
+        self.sort_desc = False
+        self.window = deque()
+        self.has_more_before = False
+        self.has_more_after = False
+        self.page_pending = False
+        self.price_range = (None, None)
+        self.product_dialog = PooledDialog(self.root, self.build_product_dialog)
         self.setup_ui()
-        self.load_products()
+        self.change_feed = ChangeFeed(self.root, self.worker, self.tree, "sanpham", self.on_remote_changes,
+                                      self.refresh_visible_products, self.load_products)
+    
+    # Quay lại từ màn hình khác: lưới vẫn giữ nguyên, chỉ lấy các thay đổi trong lúc vắng mặt
+    def on_show(self):
+        self.change_feed.refresh()
     
     def setup_ui(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
-        
-        main_frame = tk.Frame(self.root)
+        self.frame = tk.Frame(self.root)
+        main_frame = tk.Frame(self.frame)
         main_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
         tk.Label(main_frame, text="QUẢN LÝ SẢN PHẨM", font=("Arial", 18, "bold")).pack(pady=10)
@@ -126,16 +686,48 @@ class ProductManager:
         tk.Button(toolbar, text="Thêm sản phẩm", command=self.add_product_dialog).pack(side="left", padx=5)
         tk.Button(toolbar, text="Sửa sản phẩm", command=self.edit_product).pack(side="left", padx=5)
         tk.Button(toolbar, text="Xóa sản phẩm", command=self.delete_product).pack(side="left", padx=5)
-        tk.Button(toolbar, text="Quay lại", command=lambda: MainApp(self.root)).pack(side="right", padx=5)
+        tk.Button(toolbar, text="Điều chỉnh giá", command=self.adjust_prices).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Điều chỉnh số lượng", command=self.adjust_quantities).pack(side="left", padx=5)
+        # Nhập/xuất CSV đọc ghi file trên máy đang chạy CSDL nên chỉ có khi không dùng máy chủ
+        if not backend.remote:
+            csv_transfer = CsvTransfer(self.root, self.worker, "sanpham", self.load_products)
+            tk.Button(toolbar, text="Nhập CSV", command=csv_transfer.import_file).pack(side="left", padx=5)
+            tk.Button(toolbar, text="Xuất CSV", command=csv_transfer.export_file).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Quay lại", command=lambda: self.navigator.show("home")).pack(side="right", padx=5)
+        tk.Label(toolbar, textvariable=self.worker.status_var, fg="#e67e22").pack(side="right", padx=5)
         
         tk.Label(toolbar, text="Tìm kiếm:").pack(side="left", padx=5)
         self.search_var = tk.StringVar()
         tk.Entry(toolbar, textvariable=self.search_var).pack(side="left", padx=5)
         tk.Button(toolbar, text="Tìm", command=self.search_products).pack(side="left", padx=5)
-        tk.Button(toolbar, text="Hủy tìm kiếm", command=self.load_products).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Hủy tìm kiếm", command=lambda: self.live_search.clear()).pack(side="left", padx=5)
+        self.live_search = LiveSearch(self.root, self.worker, self.search_var,
+                                      profiler.wrap("search_products.db", self.repo.search), self.show_search_results,
+                                      self.load_products, lambda product: (product[1], product[2]))
+        tk.Label(toolbar, textvariable=self.live_search.notice_var, fg="#e67e22").pack(side="left", padx=5)
+        
+        filter_bar = tk.Frame(main_frame)
+        filter_bar.pack(fill="x", pady=5)
+        tk.Label(filter_bar, text="Giá bán từ:").pack(side="left", padx=5)
+        self.min_price = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.min_price, width=12).pack(side="left", padx=5)
+        tk.Label(filter_bar, text="đến:").pack(side="left", padx=5)
+        self.max_price = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.max_price, width=12).pack(side="left", padx=5)
+        tk.Button(filter_bar, text="Lọc", command=self.apply_filters).pack(side="left", padx=5)
+        tk.Button(filter_bar, text="Bỏ lọc", command=self.clear_filters).pack(side="left", padx=5)
+        
+        self.notebook = ttk.Notebook(main_frame)
+        self.notebook.pack(fill="both", expand=True)
+        list_frame = tk.Frame(self.notebook)
+        self.notebook.add(list_frame, text="Danh sách")
+        self.report_frame = tk.Frame(self.notebook)
+        self.notebook.add(self.report_frame, text="Phân tích tồn kho")
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.setup_report_tab()
         
         columns = ("ID", "Mã SP", "Tên SP", "Ảnh", "Giá nhập", "Giá bán", "Số lượng")
-        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=20)
+        self.tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=20)
         
         self.tree.column("ID", width=50)
         self.tree.column("Mã SP", width=100)
@@ -145,75 +737,197 @@ class ProductManager:
         self.tree.column("Giá bán", width=100)
         self.tree.column("Số lượng", width=80)
         
-        for col in columns:
-            self.tree.heading(col, text=col)
+        self.headings = SortableHeadings(self.tree, columns, self.SORT_COLUMNS, self.sort_by)
         
         self.tree.pack(fill="both", expand=True)
+        self.grid = TreeSync(self.tree, ProductRow.values)
         
-        scrollbar = ttk.Scrollbar(self.tree, orient="vertical", command=self.tree.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(self.tree, orient="vertical", command=self.tree.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
         
         self.tree.bind("<Double-1>", self.show_full_image)
     
+    def setup_report_tab(self):
+        self.report_var = tk.StringVar()
+        tk.Label(self.report_frame, textvariable=self.report_var, font=("Arial", 12, "bold"),
+                 fg="#2c3e50", justify="left").pack(anchor="w", pady=10)
+        
+        tables = tk.Frame(self.report_frame)
+        tables.pack(fill="both", expand=True)
+        columns = ("Mã SP", "Tên SP", "Số lượng", "Giá trị tồn", "Biên LN")
+        self.report_grids = {}
+        for index, (key, title) in enumerate((("top_value", "Giá trị tồn kho cao nhất"),
+                                              ("top_margin", "Biên lợi nhuận cao nhất"),
+                                              ("low_stock", f"Sắp hết hàng (≤ {self.LOW_STOCK_THRESHOLD})"))):
+            frame = tk.LabelFrame(tables, text=title)
+            frame.grid(row=0, column=index, sticky="nsew", padx=5)
+            tables.columnconfigure(index, weight=1)
+            tree = ttk.Treeview(frame, columns=columns, show="headings", height=20)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=150 if col == "Tên SP" else 80)
+            tree.pack(fill="both", expand=True)
+            self.report_grids[key] = TreeSync(tree)
+        tables.rowconfigure(0, weight=1)
+    
+    # Tab phân tích được tính lại mỗi lần mở, trên luồng nền
+    def on_tab_changed(self, event):
+        if self.notebook.select() == str(self.report_frame):
+            self.worker.submit(backend.inventory_report, self.REPORT_TOP_N, self.LOW_STOCK_THRESHOLD,
+                               on_done=self.show_inventory_report)
+    
+    def show_inventory_report(self, report):
+        self.report_var.set(f"Số sản phẩm: {report['count']:,}   "
+                            f"Giá trị tồn kho (giá nhập): {report['total_value']:,.0f}đ   "
+                            f"Theo giá bán: {report['total_revenue']:,.0f}đ   "
+                            f"Biên LN bình quân: {report['average_margin']:.1f}%   "
+                            f"Sắp hết hàng: {report['low_stock_count']:,}")
+        for key, grid in self.report_grids.items():
+            grid.apply([(product_id, (ma_sp, ten_sp, so_luong, f"{value:,.0f}đ", f"{margin:.1f}%"))
+                        for product_id, ma_sp, ten_sp, so_luong, value, margin in report[key]])
+    
+    # Mỗi lần yêu cầu nạp lại lưới sẽ tăng view_token để bỏ qua kết quả đến muộn của lần trước
+    def next_view(self):
+        self.view_token += 1
+        return self.view_token
+    
     def load_products(self):
-        self.image_references.clear()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, ma_sp, ten_sp, anh_sp, gia_nhap, gia_ban, so_luong FROM sanpham")
-            products = cursor.fetchall()
-        
-        for product in products:
-            img_data = product[3]
-            img_preview = "Nhấn đúp 2 lần để xem hình ảnh" if img_data and not isinstance(img_data, str) else "Không có ảnh"
-            if img_data and not isinstance(img_data, str):
-                img = ImageManager.blob_to_image(img_data)
-                if img:
-                    self.image_references.append(img)
-            
-            self.tree.insert("", "end", values=(
-                product[0], product[1], product[2], 
-                img_preview,
-                f"{product[4]:,.0f}đ", 
-                f"{product[5]:,.0f}đ", 
-                product[6]
-            ))
+        try:
+            min_price = parse_amount(self.min_price.get())
+            max_price = parse_amount(self.max_price.get())
+        except ValueError:
+            messagebox.showerror("Lỗi", "Khoảng giá bán không hợp lệ!")
+            return
+        token = self.next_view()
+        self.price_range = (min_price, max_price)
+        pager = self.repo.pager(self.PAGE_SIZE, self.sort_column, self.sort_desc, min_price, max_price)
+        self.worker.submit(profiler.wrap("load_products.db", pager.page_after), None,
+                           on_done=lambda page: self.show_first_page(token, pager, page))
+    
+    def show_first_page(self, token, pager, page):
+        if token != self.view_token:
+            return
+        self.pager = pager
+        self.reset_window()
+        self.add_page(token, page, True)
     
     def search_products(self):
-        query = self.search_var.get().strip().lower()
-        if not query:
+        self.live_search.run_now()
+    
+    # Sắp xếp và lọc đều chạy trên SQLite; khi đang tìm kiếm thì bỏ tìm kiếm để xem toàn bộ danh mục
+    def sort_by(self, column, descending):
+        self.sort_column = column
+        self.sort_desc = descending
+        self.apply_filters()
+    
+    def apply_filters(self):
+        if self.search_var.get().strip():
+            self.live_search.clear()
+        else:
             self.load_products()
+    
+    def clear_filters(self):
+        self.min_price.set("")
+        self.max_price.set("")
+        self.apply_filters()
+    
+    def show_search_results(self, products):
+        self.next_view()
+        self.pager = None
+        self.window.clear()
+        self.has_more_before = False
+        self.has_more_after = False
+        self.page_pending = False
+        with profiler.measure("search_products.tree", len(products)):
+            self.grid.apply([(product[0], ProductRow(*product)) for product in products])
+        if products:
+            self.window.append([products[0][0], products[-1][0], [str(product[0]) for product in products]])
+    
+    # Chỉ giữ tối đa MAX_WINDOW_PAGES trang quanh vị trí cuộn trong Treeview
+    def reset_window(self):
+        self.grid.clear()
+        self.window.clear()
+        self.has_more_before = False
+        self.has_more_after = False
+        self.page_pending = False
+    
+    def insert_product_row(self, index, product):
+        return self.grid.insert(index, product[0], ProductRow(*product))
+    
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.page_pending:
+            return
+        if float(last) >= 0.9 and self.has_more_after:
+            self.request_page(True)
+        elif float(first) <= 0.1 and self.has_more_before:
+            self.request_page(False)
+    
+    def request_page(self, forward):
+        if not self.window:
+            return
+        self.page_pending = True
+        token = self.view_token
+        if forward:
+            self.worker.submit(profiler.wrap("load_products.db", self.pager.page_after), self.window[-1][1],
+                               on_done=lambda page: self.add_page(token, page, True))
+        else:
+            self.worker.submit(profiler.wrap("load_products.db", self.pager.page_before), self.window[0][0],
+                               on_done=lambda page: self.add_page(token, page, False))
+    
+    def add_page(self, token, page, forward):
+        if token != self.view_token:
+            return
+        self.page_pending = False
+        if forward:
+            self.append_page(*page)
+        else:
+            self.prepend_page(*page)
+    
+    def append_page(self, products, has_more):
+        self.has_more_after = has_more
+        if not products:
             return
         
-        self.image_references.clear()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, ma_sp, ten_sp, anh_sp, gia_nhap, gia_ban, so_luong FROM sanpham "
-                          "WHERE LOWER(ma_sp) LIKE ? OR LOWER(ten_sp) LIKE ?",
-                          (f"%{query}%", f"%{query}%"))
-            products = cursor.fetchall()
+        with profiler.measure("load_products.tree", len(products)):
+            iids = [self.insert_product_row("end", product) for product in products]
+        self.window.append([self.pager.key(products[0]), self.pager.key(products[-1]), iids])
+        
+        if len(self.window) > self.MAX_WINDOW_PAGES:
+            first = self.tree.yview()[0]
+            total = len(self.tree.get_children())
+            dropped = self.window.popleft()[2]
+            self.grid.remove(*dropped)
+            self.has_more_before = True
+            remaining = total - len(dropped)
+            self.tree.yview_moveto(max(0.0, (first * total - len(dropped)) / remaining))
+        
+        if self.has_more_after:
+            self.worker.submit(self.pager.prefetch_after, self.pager.key(products[-1]), background=True)
+    
+    def prepend_page(self, products, has_more):
+        self.has_more_before = has_more
+        if not products:
+            return
         
-        for product in products:
-            img_data = product[3]
-            img_preview = "Nhấn đúp 2 lần để xem hình ảnh" if img_data and not isinstance(img_data, str) else "Không có ảnh"
-            if img_data and not isinstance(img_data, str):
-                img = ImageManager.blob_to_image(img_data)
-                if img:
-                    self.image_references.append(img)
-            
-            self.tree.insert("", "end", values=(
-                product[0], product[1], product[2], 
-                img_preview,
-                f"{product[4]:,.0f}đ", 
-                f"{product[5]:,.0f}đ", 
-                product[6]
-            ))
+        first = self.tree.yview()[0]
+        total = len(self.tree.get_children())
+        with profiler.measure("load_products.tree", len(products)):
+            iids = [self.insert_product_row(index, product) for index, product in enumerate(products)]
+        self.window.appendleft([self.pager.key(products[0]), self.pager.key(products[-1]), iids])
+        total += len(iids)
+        top = first * (total - len(iids)) + len(iids)
+        
+        if len(self.window) > self.MAX_WINDOW_PAGES:
+            dropped = self.window.pop()[2]
+            self.grid.remove(*dropped)
+            self.has_more_after = True
+            total -= len(dropped)
+        self.tree.yview_moveto(min(1.0, top / total))
+        
+        if self.has_more_before:
+            self.worker.submit(self.pager.prefetch_before, self.pager.key(products[0]), background=True)
     
     def show_full_image(self, event):
         selected = self.tree.selection()
@@ -222,30 +936,38 @@ class ProductManager:
         
         item = self.tree.item(selected[0])
         product_id = item['values'][0]
-        
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT anh_sp FROM sanpham WHERE id=?", (product_id,))
-            img_data = cursor.fetchone()[0]
-        
-        if not img_data or isinstance(img_data, str):
+        self.worker.submit(self.repo.get_image_hash, product_id, on_done=self.open_image_window)
+    
+    def open_image_window(self, image_hash):
+        photo = image_cache.get(image_hash)
+        if photo:
+            self.show_image_window(photo)
+        elif image_hash:
+            self.worker.submit(self.load_image, image_hash,
+                               on_done=lambda img: self.show_image_window(image_cache.put(image_hash, img)))
+        else:
             messagebox.showinfo("Thông báo", "Sản phẩm không có ảnh!")
-            return
-        
+    
+    # Chạy trên luồng nền
+    def load_image(self, image_hash, max_size=None):
+        with profiler.measure("image.db"):
+            blob_data = self.repo.get_image(image_hash)
+        with profiler.measure("image.decode"):
+            img = ImageManager.decode_blob(blob_data, max_size)
+        if img is None:
+            raise ValueError("Không thể đọc ảnh sản phẩm!")
+        return img
+    
+    def show_image_window(self, photo):
         img_window = tk.Toplevel(self.root)
         img_window.title("Xem ảnh sản phẩm")
         
-        img = Image.open(BytesIO(img_data))
-        photo = ImageTk.PhotoImage(img)
-        
         tk.Label(img_window, image=photo).pack()
         img_window.image = photo
     
-    def add_product_dialog(self):
-        self.dialog = tk.Toplevel(self.root)
-        self.dialog.title("Thêm sản phẩm mới")
-        self.dialog.grab_set()
-        
+    # Hộp thoại thêm/sửa dùng chung một cửa sổ, chỉ dựng lần đầu mở
+    def build_product_dialog(self, dialog):
+        self.dialog = dialog
         self.ma_sp = tk.StringVar()
         self.ten_sp = tk.StringVar()
         self.gia_nhap = tk.DoubleVar(value=0.0)
@@ -279,8 +1001,22 @@ class ProductManager:
         btn_frame = tk.Frame(self.dialog)
         btn_frame.grid(row=7, column=0, columnspan=3, pady=10)
         
-        tk.Button(btn_frame, text="Lưu", command=self.save_product).pack(side="left", padx=10)
-        tk.Button(btn_frame, text="Hủy", command=self.dialog.destroy).pack(side="left", padx=10)
+        self.product_submit = tk.Button(btn_frame)
+        self.product_submit.pack(side="left", padx=10)
+        tk.Button(btn_frame, text="Hủy", command=self.product_dialog.close).pack(side="left", padx=10)
+    
+    def open_product_dialog(self, title, values, submit_text, submit):
+        session = self.product_dialog.open(title)
+        for var, value in zip((self.ma_sp, self.ten_sp, self.gia_nhap, self.gia_ban, self.so_luong), values):
+            var.set(value)
+        self.anh_path.set("")
+        self.image_preview = None
+        self.preview_label.config(image="")
+        self.product_submit.config(text=submit_text, command=submit)
+        return session
+    
+    def add_product_dialog(self):
+        self.open_product_dialog("Thêm sản phẩm mới", ("", "", 0.0, 0.0, 0), "Lưu", self.save_product)
     
     def select_and_preview_image(self):
         file_path = filedialog.askopenfilename(
@@ -289,15 +1025,19 @@ class ProductManager:
         )
         if file_path:
             self.anh_path.set(file_path)
-            try:
-                img = ImageManager.resize_image(file_path, (150, 150))
-                if img:
-                    self.image_preview = img
-                    self.preview_label.config(image=img)
-                else:
-                    messagebox.showerror("Lỗi", "Không thể mở ảnh!")
-            except Exception as e:
-                messagebox.showerror("Lỗi", f"Không thể mở ảnh: {str(e)}")
+            session = self.product_dialog.session
+            self.worker.submit(ImageManager.open_image, file_path, ImageManager.THUMBNAIL_SIZE,
+                               on_done=lambda img: self.set_preview(img, session),
+                               on_error=lambda e: messagebox.showerror("Lỗi", f"Không thể mở ảnh: {str(e)}"))
+    
+    def set_preview(self, img, session):
+        # Ảnh đến sau khi hộp thoại đã đóng hoặc mở cho sản phẩm khác thì bỏ qua
+        if not self.product_dialog.is_open(session):
+            return
+        from PIL import ImageTk
+        photo = img if isinstance(img, ImageTk.PhotoImage) else ImageTk.PhotoImage(img)
+        self.image_preview = photo
+        self.preview_label.config(image=photo)
     
     def save_product(self):
         try:
@@ -310,32 +1050,152 @@ class ProductManager:
                 raise ValueError("Mã và tên sản phẩm không được để trống!")
             if gia_nhap < 0 or gia_ban < 0 or so_luong < 0:
                 raise ValueError("Giá và số lượng không được âm!")
-            
-            img_blob = None
-            if self.anh_path.get():
-                img_blob = ImageManager.image_to_blob(self.anh_path.get())
-                if not img_blob:
-                    raise ValueError("Không thể xử lý ảnh!")
-            
-            with sqlite3.connect("quanlybanhang.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''INSERT INTO sanpham 
-                               (ma_sp, ten_sp, anh_sp, gia_nhap, gia_ban, so_luong)
-                               VALUES (?, ?, ?, ?, ?, ?)''',
-                               (ma_sp, ten_sp, img_blob, gia_nhap, gia_ban, so_luong))
-                conn.commit()
-            
-            self.dialog.destroy()
-            self.load_products()
-        
         except tk.TclError:
             messagebox.showerror("Lỗi", "Vui lòng nhập số hợp lệ cho giá và số lượng!")
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Lỗi", "Mã sản phẩm đã tồn tại!")
+            return
         except ValueError as e:
             messagebox.showerror("Lỗi", str(e))
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+            return
+        
+        session = self.product_dialog.session
+        self.worker.submit(self.write_product, None, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, self.anh_path.get(),
+                           on_done=lambda product: self.on_product_saved(session, product), on_error=self.show_save_error)
+    
+    # Chạy trên luồng nền: tạo ảnh xem và ảnh nhỏ rồi ghi vào CSDL
+    def write_product(self, product_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, image_path):
+        with profiler.measure("image.ingest"):
+            images = ImageManager.ingest(image_path) if image_path else None
+        if product_id is None:
+            with profiler.measure("save_product.db"):
+                product_id = self.repo.insert(ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images)
+        else:
+            with profiler.measure("update_product.db"):
+                self.repo.update(product_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong, images)
+        return self.repo.get(product_id)
+    
+    def on_product_saved(self, session, product):
+        self.product_dialog.close(session)
+        if self.pager is None:
+            self.show_changed_product(product)
+        else:
+            self.merge_changed_products([product])
+    
+    # Chỉ cập nhật đúng dòng vừa thay đổi thay vì nạp lại cả lưới
+    def show_changed_product(self, product):
+        if self.pager is None:
+            self.live_search.reset_cache()
+            self.live_search.run_now()
+            return
+        
+        self.pager.invalidate()
+        iid = str(product[0])
+        key = self.pager.key(product)
+        if iid in self.grid.values:
+            if self.row_key(self.grid.values[iid]) == key:
+                self.grid.upsert(product[0], ProductRow(*product))
+                return
+            # Khóa sắp xếp đã đổi (vd. sửa giá khi đang sắp theo giá): bỏ dòng cũ rồi chèn lại đúng chỗ
+            self.remove_product_rows([product[0]])
+        if not self.has_more_after and (not self.window or self.pager.is_after(key, self.window[-1][1])):
+            self.insert_product_row("end", product)
+            if self.window:
+                self.window[-1][1] = key
+                self.window[-1][2].append(iid)
+            else:
+                self.window.append([key, key, [iid]])
+        elif not self.has_more_before and self.pager.is_after(self.window[0][0], key):
+            self.insert_product_row(0, product)
+            self.window[0][0] = key
+            self.window[0][2].insert(0, iid)
+        elif self.window and not self.pager.is_after(key, self.window[-1][1]) \
+                and not self.pager.is_after(self.window[0][0], key):
+            page, offset, index = self.window_position(key)
+            self.insert_product_row(index, product)
+            page[2].insert(offset, iid)
+    
+    def row_key(self, row):
+        return self.pager.key(ProductRow.fields(row))
+    
+    # Vị trí chèn khóa key trong cửa sổ đang hiển thị: (trang, vị trí trong trang, vị trí trong lưới)
+    def window_position(self, key):
+        index = 0
+        for page in self.window:
+            for offset, iid in enumerate(page[2]):
+                if self.pager.is_after(self.row_key(self.grid.values[iid]), key):
+                    return page, offset, index
+                index += 1
+        return self.window[-1], len(self.window[-1][2]), index
+    
+    # Sau thao tác hàng loạt: sửa các dòng đang hiển thị một lượt
+    def show_changed_products(self, products):
+        if self.pager is None:
+            self.live_search.reset_cache()
+            self.live_search.run_now()
+            return
+        
+        self.pager.invalidate()
+        self.merge_changed_products([product for product in products if str(product[0]) in self.grid.values])
+    
+    def remove_product_rows(self, product_ids):
+        if self.pager is not None:
+            self.pager.invalidate()
+        iids = set(map(str, product_ids))
+        for page in self.window:
+            page[2][:] = [iid for iid in page[2] if iid not in iids]
+        self.grid.remove(*product_ids)
+    
+    # Thay đổi từ cửa sổ hoặc máy khác (ChangeFeed): chỉ đọc lại đúng các sản phẩm đó
+    def on_remote_changes(self, changed_ids, deleted_ids):
+        self.live_search.reset_cache()
+        if deleted_ids:
+            self.remove_product_rows(deleted_ids)
+        if changed_ids:
+            self.worker.submit(self.repo.get_many, changed_ids, on_done=self.merge_changed_products, background=True)
+    
+    # Dòng đã hiển thị mà không còn khớp bộ lọc (từ khóa, khoảng giá) thì bỏ khỏi lưới
+    def merge_changed_products(self, products):
+        for product in products:
+            shown = str(product[0]) in self.grid.values
+            if self.pager is None:
+                # Đang xem kết quả tìm kiếm: chỉ sửa các dòng đã có
+                if shown and self.live_search.matches(product):
+                    self.grid.upsert(product[0], ProductRow(*product))
+                elif shown:
+                    self.grid.remove(product[0])
+            elif self.in_price_range(product):
+                self.show_changed_product(product)
+            elif shown:
+                self.remove_product_rows([product[0]])
+    
+    def in_price_range(self, product):
+        min_price, max_price = self.price_range
+        gia_ban = product[5] or 0
+        return (min_price is None or gia_ban >= min_price) and (max_price is None or gia_ban <= max_price)
+    
+    # Quá nhiều thay đổi cùng lúc (nhập CSV, thao tác hàng loạt): đọc lại các dòng đang hiển thị, giữ vị trí cuộn
+    def refresh_visible_products(self):
+        self.live_search.reset_cache()
+        if self.pager is not None:
+            self.pager.invalidate()
+        product_ids = [int(iid) for iid in self.grid.values]
+        if product_ids:
+            self.worker.submit(self.repo.get_many, product_ids,
+                               on_done=lambda products: self.replace_visible_products(product_ids, products))
+    
+    def replace_visible_products(self, product_ids, products):
+        for product in products:
+            if str(product[0]) in self.grid.values:
+                self.grid.upsert(product[0], ProductRow(*product))
+        found = {product[0] for product in products}
+        self.remove_product_rows([product_id for product_id in product_ids if product_id not in found])
+    
+    def show_save_error(self, error):
+        if isinstance(error, sqlite3.IntegrityError):
+            messagebox.showerror("Lỗi", "Mã sản phẩm đã tồn tại!")
+        elif isinstance(error, ValueError):
+            messagebox.showerror("Lỗi", str(error))
+        else:
+            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(error)}")
     
     def edit_product(self):
         selected = self.tree.selection()
@@ -344,61 +1204,28 @@ class ProductManager:
             return
         
         product_id = self.tree.item(selected[0])['values'][0]
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sanpham WHERE id=?", (product_id,))
-            product = cursor.fetchone()
-        
+        self.worker.submit(self.repo.get, product_id, on_done=self.open_edit_dialog)
+    
+    def open_edit_dialog(self, product):
         if not product:
             messagebox.showerror("Lỗi", "Không tìm thấy sản phẩm!")
             return
         
-        self.dialog = tk.Toplevel(self.root)
-        self.dialog.title("Chỉnh sửa sản phẩm")
-        self.dialog.grab_set()
-        
-        self.edit_id = product_id
-        self.ma_sp = tk.StringVar(value=product[1])
-        self.ten_sp = tk.StringVar(value=product[2])
-        self.gia_nhap = tk.DoubleVar(value=product[4])
-        self.gia_ban = tk.DoubleVar(value=product[5])
-        self.so_luong = tk.IntVar(value=product[6])
-        self.anh_blob = product[3]
-        self.anh_path = tk.StringVar()
-        self.image_preview = None
-        
-        tk.Label(self.dialog, text="Mã sản phẩm:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.ma_sp).grid(row=0, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Tên sản phẩm:").grid(row=1, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.ten_sp).grid(row=1, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Giá nhập:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.gia_nhap).grid(row=2, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Giá bán:").grid(row=3, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.gia_ban).grid(row=3, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Số lượng:").grid(row=4, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.so_luong).grid(row=4, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Ảnh sản phẩm:").grid(row=5, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.anh_path, state="readonly").grid(row=5, column=1, padx=5, pady=5)
-        tk.Button(self.dialog, text="Chọn ảnh", command=self.select_and_preview_image).grid(row=5, column=2, padx=5, pady=5)
-        
-        self.preview_label = tk.Label(self.dialog)
-        self.preview_label.grid(row=6, column=0, columnspan=3, pady=10)
-        if self.anh_blob and not isinstance(self.anh_blob, str):
-            img = ImageManager.blob_to_image(self.anh_blob)
-            if img:
-                self.image_preview = img
-                self.preview_label.config(image=img)
-        
-        btn_frame = tk.Frame(self.dialog)
-        btn_frame.grid(row=7, column=0, columnspan=3, pady=10)
-        
-        tk.Button(btn_frame, text="Cập nhật", command=self.update_product).pack(side="left", padx=10)
-        tk.Button(btn_frame, text="Hủy", command=self.dialog.destroy).pack(side="left", padx=10)
+        session = self.open_product_dialog("Chỉnh sửa sản phẩm", product[1:3] + product[4:7], "Cập nhật",
+                                           self.update_product)
+        self.edit_id = product[0]
+        # Sản phẩm lưu trước khi có ảnh nhỏ thì thu nhỏ ảnh xem khi hiển thị
+        self.anh_hash = product[7] or product[3]
+        if self.anh_hash:
+            image_hash = self.anh_hash
+            max_size = ImageManager.THUMBNAIL_SIZE
+            photo = image_cache.get(image_hash, max_size)
+            if photo:
+                self.set_preview(photo, session)
+            else:
+                self.worker.submit(self.load_image, image_hash, max_size,
+                                   on_done=lambda img: self.set_preview(image_cache.put(image_hash, img, max_size),
+                                                                        session))
     
     def update_product(self):
         try:
@@ -411,62 +1238,92 @@ class ProductManager:
                 raise ValueError("Mã và tên sản phẩm không được để trống!")
             if gia_nhap < 0 or gia_ban < 0 or so_luong < 0:
                 raise ValueError("Giá và số lượng không được âm!")
-            
-            img_blob = self.anh_blob
-            if self.anh_path.get():
-                img_blob = ImageManager.image_to_blob(self.anh_path.get())
-                if not img_blob:
-                    raise ValueError("Không thể xử lý ảnh!")
-            
-            with sqlite3.connect("quanlybanhang.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''UPDATE sanpham SET
-                               ma_sp=?, ten_sp=?, anh_sp=?, gia_nhap=?, gia_ban=?, so_luong=?
-                               WHERE id=?''',
-                               (ma_sp, ten_sp, img_blob, gia_nhap, gia_ban, so_luong, self.edit_id))
-                conn.commit()
-            
-            self.dialog.destroy()
-            self.load_products()
-        
         except tk.TclError:
             messagebox.showerror("Lỗi", "Vui lòng nhập số hợp lệ!")
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Lỗi", "Mã sản phẩm đã tồn tại!")
+            return
         except ValueError as e:
             messagebox.showerror("Lỗi", str(e))
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+            return
+        
+        session = self.product_dialog.session
+        self.worker.submit(self.write_product, self.edit_id, ma_sp, ten_sp, gia_nhap, gia_ban, so_luong,
+                           self.anh_path.get(),
+                           on_done=lambda product: self.on_product_saved(session, product), on_error=self.show_save_error)
+    
+    # iid của mỗi dòng chính là id (xem TreeSync) nên đọc thẳng từ selection
+    def selected_ids(self):
+        return [int(iid) for iid in self.tree.selection()]
     
     def delete_product(self):
-        selected = self.tree.selection()
-        if not selected:
+        product_ids = self.selected_ids()
+        if not product_ids:
             messagebox.showwarning("Cảnh báo", "Vui lòng chọn sản phẩm cần xóa!")
             return
         
-        product_id = self.tree.item(selected[0])['values'][0]
-        if messagebox.askyesno("Xác nhận", "Bạn có chắc chắn muốn xóa sản phẩm này?"):
-            try:
-                with sqlite3.connect("quanlybanhang.db") as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM sanpham WHERE id=?", (product_id,))
-                    conn.commit()
-                
-                self.load_products()
-            except sqlite3.Error as e:
-                messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+        if messagebox.askyesno("Xác nhận", f"Bạn có chắc chắn muốn xóa {len(product_ids)} sản phẩm đã chọn?"):
+            self.worker.submit(self.repo.delete_many, product_ids,
+                               on_done=lambda _: self.remove_product_rows(product_ids))
+    
+    def adjust_prices(self):
+        product_ids = self.selected_ids()
+        if not product_ids:
+            messagebox.showwarning("Cảnh báo", "Vui lòng chọn sản phẩm cần điều chỉnh!")
+            return
+        
+        percent = simpledialog.askfloat("Điều chỉnh giá bán",
+                                        f"Tăng giá bán của {len(product_ids)} sản phẩm thêm bao nhiêu %?\n"
+                                        "(nhập số âm để giảm giá)", parent=self.root, minvalue=-100)
+        if percent:
+            self.worker.submit(self.run_bulk, self.repo.adjust_prices, product_ids, percent,
+                               on_done=self.show_changed_products)
+    
+    def adjust_quantities(self):
+        product_ids = self.selected_ids()
+        if not product_ids:
+            messagebox.showwarning("Cảnh báo", "Vui lòng chọn sản phẩm cần điều chỉnh!")
+            return
+        
+        delta = simpledialog.askinteger("Điều chỉnh số lượng",
+                                        f"Cộng thêm vào số lượng của {len(product_ids)} sản phẩm\n"
+                                        "(nhập số âm để trừ, không xuống dưới 0)", parent=self.root)
+        if delta:
+            self.worker.submit(self.run_bulk, self.repo.adjust_quantities, product_ids, delta,
+                               on_done=self.show_changed_products)
+    
+    # Chạy trên luồng nền: một giao dịch rồi đọc lại các dòng đã đổi để làm mới lưới một lần
+    def run_bulk(self, action, product_ids, value):
+        action(product_ids, value)
+        return self.repo.get_many(product_ids)
 
 class OrderManager:
-    def __init__(self, root):
+    INSERT_CHUNK = 500
+    SORT_COLUMNS = {"ID": "id", "Tên KH": "ten_kh", "Danh mục": "danh_muc", "Ngày đặt": "ngay_dat",
+                    "Ngày giao": "ngay_giao", "Tổng tiền": "tong_tien", "Đã cọc": "da_coc",
+                    "Còn thiếu": "con_thieu", "Trạng thái": "trang_thai"}
+    STATUSES = ["đang đặt", "đã về", "đã giao", backend.orders.CANCELLED]
+    
+    def __init__(self, root, worker, navigator):
         self.root = root
+        self.worker = worker
+        self.navigator = navigator
+        self.repo = backend.orders
+        self.product_repo = backend.products
+        self.sort_column = "id"
+        self.sort_desc = False
+        self.view_token = 0
+        self.reload_view = self.load_orders
+        self.order_dialog = PooledDialog(self.root, self.build_order_dialog)
+        self.status_dialog = PooledDialog(self.root, self.build_status_dialog)
         self.setup_ui()
-        self.load_orders()
+        self.change_feed = ChangeFeed(self.root, self.worker, self.tree, "khachhang", self.on_remote_changes,
+                                      self.refresh_view, self.load_orders)
+    
+    def on_show(self):
+        self.change_feed.refresh()
     
     def setup_ui(self):
-        for widget in self.root.winfo_children():
-            widget.destroy()
-        
-        main_frame = tk.Frame(self.root)
+        self.frame = tk.Frame(self.root)
+        main_frame = tk.Frame(self.frame)
         main_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
         tk.Label(main_frame, text="QUẢN LÝ ĐƠN HÀNG", font=("Arial", 18, "bold")).pack(pady=10)
@@ -478,23 +1335,56 @@ class OrderManager:
         tk.Button(toolbar, text="Sửa đơn hàng", command=self.edit_order).pack(side="left", padx=5)
         tk.Button(toolbar, text="Cập nhật trạng thái", command=self.update_status).pack(side="left", padx=5)
         tk.Button(toolbar, text="Xóa đơn hàng", command=self.delete_order).pack(side="left", padx=5)
-        tk.Button(toolbar, text="Quay lại", command=lambda: MainApp(self.root)).pack(side="right", padx=5)
+        tk.Button(toolbar, text="Cần giao tuần này", command=self.load_due_this_week).pack(side="left", padx=5)
+        # Nhập/xuất CSV đọc ghi file trên máy đang chạy CSDL nên chỉ có khi không dùng máy chủ
+        if not backend.remote:
+            csv_transfer = CsvTransfer(self.root, self.worker, "khachhang", self.load_orders)
+            tk.Button(toolbar, text="Nhập CSV", command=csv_transfer.import_file).pack(side="left", padx=5)
+            tk.Button(toolbar, text="Xuất CSV", command=csv_transfer.export_file).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Quay lại", command=lambda: self.navigator.show("home")).pack(side="right", padx=5)
+        tk.Label(toolbar, textvariable=self.worker.status_var, fg="#e67e22").pack(side="right", padx=5)
         
         tk.Label(toolbar, text="Tìm kiếm:").pack(side="left", padx=5)
         self.search_var = tk.StringVar()
         tk.Entry(toolbar, textvariable=self.search_var).pack(side="left", padx=5)
         tk.Button(toolbar, text="Tìm", command=self.search_orders).pack(side="left", padx=5)
-        tk.Button(toolbar, text="Hủy tìm kiếm", command=self.load_orders).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Hủy tìm kiếm", command=lambda: self.live_search.clear()).pack(side="left", padx=5)
+        self.live_search = LiveSearch(self.root, self.worker, self.search_var,
+                                      profiler.wrap("search_orders.db", self.search_rows), self.show_orders,
+                                      self.load_orders, lambda order: (order.ten_kh, order.danh_muc))
+        tk.Label(toolbar, textvariable=self.live_search.notice_var, fg="#e67e22").pack(side="left", padx=5)
+        
+        filter_bar = tk.Frame(main_frame)
+        filter_bar.pack(fill="x", pady=5)
+        tk.Label(filter_bar, text="Trạng thái:").pack(side="left", padx=5)
+        self.status_filter = tk.StringVar(value="Tất cả")
+        ttk.Combobox(filter_bar, textvariable=self.status_filter, values=["Tất cả"] + self.STATUSES,
+                     state="readonly", width=12).pack(side="left", padx=5)
+        tk.Label(filter_bar, text="Ngày đặt từ:").pack(side="left", padx=5)
+        self.date_from = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.date_from, width=12).pack(side="left", padx=5)
+        tk.Label(filter_bar, text="đến:").pack(side="left", padx=5)
+        self.date_to = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.date_to, width=12).pack(side="left", padx=5)
+        tk.Label(filter_bar, text="Còn thiếu từ:").pack(side="left", padx=5)
+        self.min_due = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.min_due, width=12).pack(side="left", padx=5)
+        tk.Label(filter_bar, text="đến:").pack(side="left", padx=5)
+        self.max_due = tk.StringVar()
+        tk.Entry(filter_bar, textvariable=self.max_due, width=12).pack(side="left", padx=5)
+        tk.Button(filter_bar, text="Lọc", command=self.apply_filters).pack(side="left", padx=5)
+        tk.Button(filter_bar, text="Bỏ lọc", command=self.clear_filters).pack(side="left", padx=5)
         
         columns = ("ID", "Tên KH", "Danh mục", "Ngày đặt", "Ngày giao", "File SP",
                    "Tổng tiền", "Đã cọc", "Còn thiếu", "Trạng thái")
         self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=20)
         
         for col in columns:
-            self.tree.heading(col, text=col)
             self.tree.column(col, width=100 if col not in ["Tên KH", "Danh mục", "File SP"] else 150)
+        self.headings = SortableHeadings(self.tree, columns, self.SORT_COLUMNS, self.sort_by)
         
         self.tree.pack(fill="both", expand=True)
+        self.grid = TreeSync(self.tree, OrderRow.values)
         
         scrollbar = ttk.Scrollbar(self.tree, orient="vertical", command=self.tree.yview)
         scrollbar.pack(side="right", fill="y")
@@ -523,6 +1413,8 @@ class OrderManager:
             messagebox.showwarning("Cảnh báo", "File không tồn tại hoặc chưa được chọn!")
             return
         
+        import platform
+        import subprocess
         try:
             if platform.system() == "Windows":
                 os.startfile(file_path)
@@ -532,50 +1424,105 @@ class OrderManager:
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể mở file: {str(e)}")
     
+    # Mỗi lần yêu cầu nạp lại lưới sẽ tăng view_token để bỏ qua kết quả đến muộn của lần trước
+    def next_view(self):
+        self.view_token += 1
+        return self.view_token
+    
     def load_orders(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, "
-                          "tong_tien, da_coc, con_thieu, trang_thai FROM khachhang")
-            orders = cursor.fetchall()
-        
-        for order in orders:
-            self.tree.insert("", "end", values=(
-                order[0], order[1], order[2], order[3], order[4], order[5],
-                f"{order[6]:,.0f}đ", f"{order[7]:,.0f}đ", f"{order[8]:,.0f}đ", order[9]
-            ))
+        try:
+            filters = self.current_filters()
+        except ValueError:
+            messagebox.showerror("Lỗi", "Điều kiện lọc không hợp lệ (ngày dạng dd/mm/yyyy, số tiền là số)!")
+            return
+        self.reload_view = self.load_orders
+        token = self.next_view()
+        self.worker.submit(profiler.wrap("load_orders.db", self.read_orders), self.sort_column, self.sort_desc, *filters,
+                           on_done=lambda orders: self.show_orders(orders, token))
     
-    def search_orders(self):
-        query = self.search_var.get().strip().lower()
-        if not query:
+    # Chạy trên luồng nền: đọc từng đợt (fetchmany) thẳng thành OrderRow, không giữ cả danh sách tuple
+    def read_orders(self, *filters):
+        return OrderRow.from_chunks(self.repo.stream(*filters, size=self.INSERT_CHUNK))
+    
+    def search_rows(self, query, limit=500):
+        return OrderRow.from_rows(self.repo.search(query, limit))
+    
+    def due_rows(self, start_date, end_date, trang_thai):
+        return OrderRow.from_rows(self.repo.due_between(start_date, end_date, trang_thai))
+    
+    def current_filters(self):
+        status = self.status_filter.get()
+        return (None if status == "Tất cả" else status,
+                to_iso_date(self.date_from.get().strip()) or None,
+                to_iso_date(self.date_to.get().strip()) or None,
+                parse_amount(self.min_due.get()),
+                parse_amount(self.max_due.get()))
+    
+    # Đổi thứ tự thì nạp lại từ đầu thay vì di chuyển từng dòng trong Treeview
+    def sort_by(self, column, descending):
+        self.sort_column = column
+        self.sort_desc = descending
+        self.grid.clear()
+        self.apply_filters()
+    
+    def apply_filters(self):
+        if self.search_var.get().strip():
+            self.live_search.clear()
+        else:
             self.load_orders()
+    
+    def clear_filters(self):
+        self.status_filter.set("Tất cả")
+        for var in (self.date_from, self.date_to, self.min_due, self.max_due):
+            var.set("")
+        self.apply_filters()
+    
+    # Đơn còn "đang đặt" có ngày giao trong tuần hiện tại (thứ Hai đến Chủ nhật)
+    # (thứ Hai, Chủ nhật) của tuần này, dạng ISO
+    @staticmethod
+    def due_week():
+        monday = date.today() - timedelta(days=date.today().weekday())
+        return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+    
+    def load_due_this_week(self):
+        self.reload_view = self.load_due_this_week
+        token = self.next_view()
+        self.worker.submit(profiler.wrap("load_orders.db", self.due_rows), *self.due_week(),
+                           "đang đặt", on_done=lambda orders: self.show_orders(orders, token))
+    
+    def search_orders(self):
+        self.live_search.run_now()
+    
+    def show_orders(self, orders, token=None):
+        if token is None:
+            token = self.next_view()
+        elif token != self.view_token:
             return
-        
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, "
-                          "tong_tien, da_coc, con_thieu, trang_thai FROM khachhang "
-                          "WHERE LOWER(ten_kh) LIKE ? OR LOWER(danh_muc) LIKE ?",
-                          (f"%{query}%", f"%{query}%"))
-            orders = cursor.fetchall()
-        
-        for order in orders:
-            self.tree.insert("", "end", values=(
-                order[0], order[1], order[2], order[3], order[4], order[5],
-                f"{order[6]:,.0f}đ", f"{order[7]:,.0f}đ", f"{order[8]:,.0f}đ", order[9]
-            ))
+        # Ít thay đổi thì chỉ sửa phần khác (giữ vị trí cuộn, dòng đang chọn); nhiều thay đổi hoặc phải đổi thứ tự
+        # (vd. từ kết quả tìm kiếm xếp theo bm25) thì xóa rồi chèn lại từng đợt để cửa sổ không bị treo
+        rows = [(order.id, order) for order in orders]
+        diff_size = self.grid.diff_size(rows) if self.grid.values else None
+        if diff_size is not None and diff_size <= self.INSERT_CHUNK:
+            with profiler.measure("load_orders.tree", diff_size):
+                self.grid.apply(rows)
+        else:
+            self.grid.clear()
+            self.insert_chunk(token, orders, 0)
     
-    def add_order_dialog(self):
-        self.dialog = tk.Toplevel(self.root)
-        self.dialog.title("Thêm đơn hàng mới")
-        self.dialog.grab_set()
-        
+    # Chèn từng đợt nhỏ để vòng lặp Tk vẫn xử lý sự kiện khi lưới có hàng trăm nghìn dòng
+    def insert_chunk(self, token, orders, start):
+        if token != self.view_token:
+            return
+        chunk = orders[start:start + self.INSERT_CHUNK]
+        with profiler.measure("load_orders.tree", len(chunk)):
+            for order in chunk:
+                self.grid.upsert(order.id, order)
+        if start + self.INSERT_CHUNK < len(orders):
+            self.root.after(1, self.insert_chunk, token, orders, start + self.INSERT_CHUNK)
+    
+    # Hộp thoại thêm/sửa dùng chung một cửa sổ, chỉ dựng lần đầu mở
+    def build_order_dialog(self, dialog):
+        self.dialog = dialog
         self.ten_kh = tk.StringVar()
         self.danh_muc = tk.StringVar()
         self.ngay_dat = tk.StringVar()
@@ -592,30 +1539,49 @@ class OrderManager:
         tk.Entry(self.dialog, textvariable=self.danh_muc).grid(row=1, column=1, padx=5, pady=5)
         
         tk.Label(self.dialog, text="Ngày đặt hàng:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
-        DateEntry(self.dialog, textvariable=self.ngay_dat, date_pattern='dd/mm/yyyy').grid(row=2, column=1, padx=5, pady=5)
+        date_entry(self.dialog, textvariable=self.ngay_dat).grid(row=2, column=1, padx=5, pady=5)
         
         tk.Label(self.dialog, text="Ngày giao hàng:").grid(row=3, column=0, padx=5, pady=5, sticky="e")
-        DateEntry(self.dialog, textvariable=self.ngay_giao, date_pattern='dd/mm/yyyy').grid(row=3, column=1, padx=5, pady=5)
+        date_entry(self.dialog, textvariable=self.ngay_giao).grid(row=3, column=1, padx=5, pady=5)
         
         tk.Label(self.dialog, text="File sản phẩm:").grid(row=4, column=0, padx=5, pady=5, sticky="e")
         tk.Entry(self.dialog, textvariable=self.file_sp, state="readonly").grid(row=4, column=1, padx=5, pady=5)
         tk.Button(self.dialog, text="Chọn file", command=self.select_file).grid(row=4, column=2, padx=5, pady=5)
         
         tk.Label(self.dialog, text="Tổng tiền:").grid(row=5, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.tong_tien).grid(row=5, column=1, padx=5, pady=5)
+        tong_tien_entry = tk.Entry(self.dialog, textvariable=self.tong_tien)
+        tong_tien_entry.grid(row=5, column=1, padx=5, pady=5)
         
         tk.Label(self.dialog, text="Đã cọc:").grid(row=6, column=0, padx=5, pady=5, sticky="e")
         tk.Entry(self.dialog, textvariable=self.da_coc).grid(row=6, column=1, padx=5, pady=5)
         
         tk.Label(self.dialog, text="Trạng thái:").grid(row=7, column=0, padx=5, pady=5, sticky="e")
         ttk.Combobox(self.dialog, textvariable=self.trang_thai,
-                     values=["đang đặt", "đã về", "đã giao"], state="readonly").grid(row=7, column=1, padx=5, pady=5)
+                     values=self.STATUSES, state="readonly").grid(row=7, column=1, padx=5, pady=5)
+        
+        self.items_editor = OrderItemsEditor(self.dialog, self.worker, self.product_repo, self.tong_tien,
+                                             tong_tien_entry, row=8)
         
         btn_frame = tk.Frame(self.dialog)
-        btn_frame.grid(row=8, column=0, columnspan=3, pady=10)
+        btn_frame.grid(row=9, column=0, columnspan=3, pady=10)
         
-        tk.Button(btn_frame, text="Lưu", command=self.save_order).pack(side="left", padx=10)
-        tk.Button(btn_frame, text="Hủy", command=self.dialog.destroy).pack(side="left", padx=10)
+        self.order_submit = tk.Button(btn_frame)
+        self.order_submit.pack(side="left", padx=10)
+        tk.Button(btn_frame, text="Hủy", command=self.order_dialog.close).pack(side="left", padx=10)
+    
+    def open_order_dialog(self, title, values, submit_text, submit):
+        session = self.order_dialog.open(title)
+        self.items_editor.reset()
+        for var, value in zip((self.ten_kh, self.danh_muc, self.ngay_dat, self.ngay_giao, self.file_sp,
+                               self.tong_tien, self.da_coc, self.trang_thai), values):
+            var.set(value)
+        self.order_submit.config(text=submit_text, command=submit)
+        return session
+    
+    def add_order_dialog(self):
+        today = date.today().strftime("%d/%m/%Y")
+        self.open_order_dialog("Thêm đơn hàng mới", ("", "", today, today, "", 0.0, 0.0, "đang đặt"), "Lưu",
+                               self.save_order)
     
     def select_file(self):
         file_path = filedialog.askopenfilename(title="Chọn file sản phẩm")
@@ -641,25 +1607,116 @@ class OrderManager:
                 date_format = "%d/%m/%Y"
                 if datetime.strptime(ngay_giao, date_format) < datetime.strptime(ngay_dat, date_format):
                     raise ValueError("Ngày giao phải sau ngày đặt!")
-            
-            with sqlite3.connect("quanlybanhang.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''INSERT INTO khachhang
-                               (ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, trang_thai)
-                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                               (ten_kh, danh_muc, ngay_dat, ngay_giao, self.file_sp.get(), 
-                                tong_tien, da_coc, self.trang_thai.get()))
-                conn.commit()
-            
-            self.dialog.destroy()
-            self.load_orders()
-        
         except tk.TclError:
             messagebox.showerror("Lỗi", "Vui lòng nhập số tiền hợp lệ!")
+            return
         except ValueError as e:
             messagebox.showerror("Lỗi", str(e))
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+            return
+        
+        session = self.order_dialog.session
+        self.worker.submit(self.write_order, None, ten_kh, danh_muc, to_iso_date(ngay_dat),
+                           to_iso_date(ngay_giao), self.file_sp.get(), tong_tien, da_coc, self.trang_thai.get(),
+                           self.items_editor.items_for_save(),
+                           on_done=lambda order: self.on_order_saved(session, order), on_error=self.show_save_error)
+    
+    # Chạy trên luồng nền
+    def write_order(self, order_id, *fields):
+        if order_id is None:
+            with profiler.measure("save_order.db"):
+                order_id = self.repo.insert(*fields)
+        else:
+            with profiler.measure("update_order.db"):
+                self.repo.update(order_id, *fields)
+        return self.repo.get(order_id)
+    
+    def change_status(self, order_ids, new_status):
+        with profiler.measure("update_status.db", len(order_ids)):
+            self.repo.set_status_many(order_ids, new_status)
+        return self.repo.get_many(order_ids)
+    
+    def on_order_saved(self, session, order):
+        self.order_dialog.close(session)
+        self.show_changed_orders([order])
+    
+    # Hết hàng (OutOfStockError) và lỗi kiểm tra dữ liệu là ValueError
+    def show_save_error(self, error):
+        if isinstance(error, ValueError):
+            messagebox.showerror("Lỗi", str(error))
+        else:
+            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(error)}")
+    
+    def on_orders_saved(self, session, orders):
+        self.status_dialog.close(session)
+        self.show_changed_orders(orders)
+    
+    # Chỉ cập nhật đúng các dòng vừa thay đổi thay vì nạp lại cả lưới
+    def show_changed_orders(self, orders):
+        if self.search_var.get().strip():
+            self.live_search.reset_cache()
+            self.live_search.run_now()
+        elif self.reload_view != self.load_orders or not self.is_default_view():
+            self.reload_view()
+        else:
+            for order in orders:
+                self.grid.upsert(order[0], OrderRow(*order))
+    
+    # Thay đổi từ cửa sổ hoặc máy khác (ChangeFeed): sửa các dòng đang hiển thị, đơn mới chỉ chèn khi xem toàn bộ
+    def on_remote_changes(self, changed_ids, deleted_ids):
+        self.live_search.reset_cache()
+        if deleted_ids:
+            self.grid.remove(*deleted_ids)
+        if changed_ids:
+            self.worker.submit(self.repo.get_many, changed_ids, on_done=self.merge_changed_orders, background=True)
+    
+    # Danh sách đầy đủ: chèn/sửa từng dòng; kết quả tìm kiếm: sửa hoặc bỏ dòng đã có; đang lọc/sắp xếp: đơn đổi
+    # trạng thái, ngày, số tiền có thể ra/vào bộ lọc hoặc đổi vị trí nên nạp lại (TreeSync chỉ sửa phần khác)
+    def merge_changed_orders(self, orders):
+        orders = [OrderRow(*order) for order in sorted(orders)]
+        if self.search_var.get().strip():
+            for order in orders:
+                if str(order.id) not in self.grid.values:
+                    continue
+                if self.live_search.matches(order):
+                    self.grid.upsert(order.id, order)
+                else:
+                    self.grid.remove(order.id)
+        elif self.reload_view == self.load_orders and self.is_default_view():
+            for order in orders:
+                self.grid.upsert(order.id, order)
+        elif any(str(order.id) in self.grid.values or self.matches_view(order) for order in orders):
+            self.reload_view()
+    
+    # Cùng điều kiện với list_query/due_between, so trên giá trị gốc
+    def matches_view(self, order):
+        if self.reload_view == self.load_due_this_week:
+            start_date, end_date = self.due_week()
+            return order.trang_thai == "đang đặt" and start_date <= (order.ngay_giao or "") <= end_date
+        try:
+            trang_thai, date_from, date_to, min_due, max_due = self.current_filters()
+        except ValueError:
+            return True
+        ngay_dat = order.ngay_dat or ""
+        return ((trang_thai is None or order.trang_thai == trang_thai)
+                and (date_from is None or ngay_dat >= date_from) and (date_to is None or ngay_dat <= date_to)
+                and (min_due is None or (order.con_thieu is not None and order.con_thieu >= min_due))
+                and (max_due is None or (order.con_thieu is not None and order.con_thieu <= max_due)))
+    
+    # Quá nhiều thay đổi cùng lúc: nạp lại; TreeSync.apply chỉ sửa phần khác nên lưới không bị xóa trắng
+    def refresh_view(self):
+        self.live_search.reset_cache()
+        if self.search_var.get().strip():
+            self.live_search.run_now()
+        else:
+            self.reload_view()
+    
+    # Danh sách đầy đủ theo id tăng dần: đơn mới luôn nằm cuối nên chỉ cần chèn/sửa một dòng
+    def is_default_view(self):
+        try:
+            filters = self.current_filters()
+        except ValueError:
+            return False
+        return self.sort_column == "id" and not self.sort_desc and all(value is None for value in filters)
     
     def edit_order(self):
         selected = self.tree.selection()
@@ -668,60 +1725,24 @@ class OrderManager:
             return
         
         order_id = self.tree.item(selected[0])['values'][0]
-        with sqlite3.connect("quanlybanhang.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM khachhang WHERE id=?", (order_id,))
-            order = cursor.fetchone()
-        
+        self.worker.submit(self.repo.get, order_id, on_done=self.open_edit_dialog)
+    
+    def open_edit_dialog(self, order):
         if not order:
             messagebox.showerror("Lỗi", "Không tìm thấy đơn hàng!")
             return
         
-        self.dialog = tk.Toplevel(self.root)
-        self.dialog.title("Chỉnh sửa đơn hàng")
-        self.dialog.grab_set()
-        
-        self.edit_id = order_id
-        self.ten_kh = tk.StringVar(value=order[1])
-        self.danh_muc = tk.StringVar(value=order[2])
-        self.ngay_dat = tk.StringVar(value=order[3])
-        self.ngay_giao = tk.StringVar(value=order[4] if order[4] else "")
-        self.file_sp = tk.StringVar(value=order[5] if order[5] else "")
-        self.tong_tien = tk.DoubleVar(value=order[6])
-        self.da_coc = tk.DoubleVar(value=order[7])
-        self.trang_thai = tk.StringVar(value=order[9])
-        
-        tk.Label(self.dialog, text="Tên khách hàng:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.ten_kh).grid(row=0, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Danh mục hàng:").grid(row=1, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.danh_muc).grid(row=1, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Ngày đặt hàng:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
-        DateEntry(self.dialog, textvariable=self.ngay_dat, date_pattern='dd/mm/yyyy').grid(row=2, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Ngày giao hàng:").grid(row=3, column=0, padx=5, pady=5, sticky="e")
-        DateEntry(self.dialog, textvariable=self.ngay_giao, date_pattern='dd/mm/yyyy').grid(row=3, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="File sản phẩm:").grid(row=4, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.file_sp, state="readonly").grid(row=4, column=1, padx=5, pady=5)
-        tk.Button(self.dialog, text="Chọn file", command=self.select_file).grid(row=4, column=2, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Tổng tiền:").grid(row=5, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.tong_tien).grid(row=5, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Đã cọc:").grid(row=6, column=0, padx=5, pady=5, sticky="e")
-        tk.Entry(self.dialog, textvariable=self.da_coc).grid(row=6, column=1, padx=5, pady=5)
-        
-        tk.Label(self.dialog, text="Trạng thái:").grid(row=7, column=0, padx=5, pady=5, sticky="e")
-        ttk.Combobox(self.dialog, textvariable=self.trang_thai,
-                     values=["đang đặt", "đã về", "đã giao"], state="readonly").grid(row=7, column=1, padx=5, pady=5)
-        
-        btn_frame = tk.Frame(self.dialog)
-        btn_frame.grid(row=8, column=0, columnspan=3, pady=10)
-        
-        tk.Button(btn_frame, text="Cập nhật", command=self.update_order).pack(side="left", padx=10)
-        tk.Button(btn_frame, text="Hủy", command=self.dialog.destroy).pack(side="left", padx=10)
+        session = self.open_order_dialog("Chỉnh sửa đơn hàng",
+                                         (order[1], order[2], to_display_date(order[3]), to_display_date(order[4]),
+                                          order[5] or "", order[6], order[7], order[9]),
+                                         "Cập nhật", self.update_order)
+        self.edit_id = order[0]
+        self.items_editor.loaded = False
+        self.worker.submit(self.repo.get_items, order[0], on_done=lambda rows: self.show_order_items(session, rows))
+    
+    def show_order_items(self, session, rows):
+        if self.order_dialog.is_open(session):
+            self.items_editor.set_items(rows)
     
     def update_order(self):
         try:
@@ -742,26 +1763,22 @@ class OrderManager:
                 date_format = "%d/%m/%Y"
                 if datetime.strptime(ngay_giao, date_format) < datetime.strptime(ngay_dat, date_format):
                     raise ValueError("Ngày giao phải sau ngày đặt!")
-            
-            with sqlite3.connect("quanlybanhang.db") as conn:
-                cursor = conn.cursor()
-                cursor.execute('''UPDATE khachhang SET
-                               ten_kh=?, danh_muc=?, ngay_dat=?, ngay_giao=?, file_sp=?,
-                               tong_tien=?, da_coc=?, trang_thai=?
-                               WHERE id=?''',
-                               (ten_kh, danh_muc, ngay_dat, ngay_giao, self.file_sp.get(),
-                                tong_tien, da_coc, self.trang_thai.get(), self.edit_id))
-                conn.commit()
-            
-            self.dialog.destroy()
-            self.load_orders()
-        
         except tk.TclError:
             messagebox.showerror("Lỗi", "Vui lòng nhập số tiền hợp lệ!")
+            return
         except ValueError as e:
             messagebox.showerror("Lỗi", str(e))
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+            return
+        
+        session = self.order_dialog.session
+        self.worker.submit(self.write_order, self.edit_id, ten_kh, danh_muc, to_iso_date(ngay_dat),
+                           to_iso_date(ngay_giao), self.file_sp.get(), tong_tien, da_coc, self.trang_thai.get(),
+                           self.items_editor.items_for_save(),
+                           on_done=lambda order: self.on_order_saved(session, order), on_error=self.show_save_error)
+    
+    # iid của mỗi dòng chính là id (xem TreeSync) nên đọc thẳng từ selection
+    def selected_ids(self):
+        return [int(iid) for iid in self.tree.selection()]
     
     def update_status(self):
         selected = self.tree.selection()
@@ -769,57 +1786,356 @@ class OrderManager:
             messagebox.showwarning("Cảnh báo", "Vui lòng chọn đơn hàng cần cập nhật!")
             return
         
-        order_id = self.tree.item(selected[0])['values'][0]
-        current_status = self.tree.item(selected[0])['values'][9]
-        
-        dialog = tk.Toplevel(self.root)
-        dialog.title("Cập nhật trạng thái đơn hàng")
-        dialog.grab_set()
+        current_statuses = {self.grid.values[iid].trang_thai for iid in selected}
+        current_status = current_statuses.pop() if len(current_statuses) == 1 else ""
+        # Chỉ ghi các đơn thực sự đổi trạng thái
+        statuses = {int(iid): self.grid.values[iid].trang_thai for iid in selected}
         
-        tk.Label(dialog, text="Trạng thái mới:").pack(pady=5)
-        status_var = tk.StringVar(value=current_status)
-        ttk.Combobox(dialog, textvariable=status_var,
-                     values=["đang đặt", "đã về", "đã giao"], state="readonly").pack(pady=5)
+        self.status_dialog.open("Cập nhật trạng thái đơn hàng")
+        self.status_targets = statuses
+        self.status_title.set(f"Trạng thái mới cho {len(selected)} đơn hàng:")
+        self.status_var.set(current_status)
+    
+    def build_status_dialog(self, dialog):
+        self.status_title = tk.StringVar()
+        self.status_var = tk.StringVar()
+        tk.Label(dialog, textvariable=self.status_title).pack(pady=5)
+        ttk.Combobox(dialog, textvariable=self.status_var,
+                     values=self.STATUSES, state="readonly").pack(pady=5)
+        
+        tk.Button(dialog, text="Cập nhật", command=self.apply_status).pack(pady=10)
+        tk.Button(dialog, text="Hủy", command=self.status_dialog.close).pack(pady=5)
+    
+    def apply_status(self):
+        new_status = self.status_var.get()
+        order_ids = [order_id for order_id, status in self.status_targets.items() if status != new_status]
+        if not new_status or not order_ids:
+            self.status_dialog.close()
+            return
         
-        def do_update():
-            new_status = status_var.get()
-            if new_status == current_status:
-                dialog.destroy()
-                return
-            
-            try:
-                with sqlite3.connect("quanlybanhang.db") as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE khachhang SET trang_thai=? WHERE id=?", (new_status, order_id))
-                    conn.commit()
-                
-                dialog.destroy()
-                self.load_orders()
-            except sqlite3.Error as e:
-                messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
-        
-        tk.Button(dialog, text="Cập nhật", command=do_update).pack(pady=10)
-        tk.Button(dialog, text="Hủy", command=dialog.destroy).pack(pady=5)
+        session = self.status_dialog.session
+        self.worker.submit(self.change_status, order_ids, new_status,
+                           on_done=lambda orders: self.on_orders_saved(session, orders),
+                           on_error=self.show_save_error)
     
     def delete_order(self):
-        selected = self.tree.selection()
-        if not selected:
+        order_ids = self.selected_ids()
+        if not order_ids:
             messagebox.showwarning("Cảnh báo", "Vui lòng chọn đơn hàng cần xóa!")
             return
         
-        order_id = self.tree.item(selected[0])['values'][0]
-        if messagebox.askyesno("Xác nhận", "Bạn có chắc chắn muốn xóa đơn hàng này?"):
-            try:
-                with sqlite3.connect("quanlybanhang.db") as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM khachhang WHERE id=?", (order_id,))
-                    conn.commit()
-                messagebox.showinfo("Thành công", "Xóa đơn hàng thành công!")
-                self.load_orders()
-            except sqlite3.Error as e:
-                messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}")
+        if messagebox.askyesno("Xác nhận", f"Bạn có chắc chắn muốn xóa {len(order_ids)} đơn hàng đã chọn?"):
+            self.worker.submit(self.repo.delete_many, order_ids, on_done=lambda _: self.on_orders_deleted(order_ids))
+    
+    def on_orders_deleted(self, order_ids):
+        messagebox.showinfo("Thành công", f"Đã xóa {len(order_ids)} đơn hàng!")
+        self.grid.remove(*order_ids)
+
+# Báo cáo đọc từ bảng tổng hợp baocao_tonghop (được trigger cập nhật), không quét bảng khachhang
+class ReportManager:
+    TABS = (
+        ("ngay", "Theo ngày", "Ngày đặt"),
+        ("thang", "Theo tháng", "Tháng"),
+        ("danh_muc", "Theo danh mục", "Danh mục"),
+        ("trang_thai", "Theo trạng thái", "Trạng thái"),
+    )
+    
+    def __init__(self, root, worker, navigator):
+        self.root = root
+        self.worker = worker
+        self.navigator = navigator
+        self.repo = backend.reports
+        self.setup_ui()
+        self.load_reports()
+    
+    # Bảng tổng hợp nhỏ nên mỗi lần quay lại chỉ cần đọc lại
+    def on_show(self):
+        self.load_reports()
+    
+    def setup_ui(self):
+        self.frame = tk.Frame(self.root)
+        main_frame = tk.Frame(self.frame)
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        tk.Label(main_frame, text="BÁO CÁO DOANH THU", font=("Arial", 18, "bold")).pack(pady=10)
+        
+        toolbar = tk.Frame(main_frame)
+        toolbar.pack(fill="x", pady=10)
+        
+        today = date.today()
+        tk.Label(toolbar, text="Từ ngày:").pack(side="left", padx=5)
+        self.tu_ngay = tk.StringVar(value=to_display_date((today - timedelta(days=90)).isoformat()))
+        date_entry(toolbar, textvariable=self.tu_ngay).pack(side="left", padx=5)
+        tk.Label(toolbar, text="Đến ngày:").pack(side="left", padx=5)
+        self.den_ngay = tk.StringVar(value=to_display_date(today.isoformat()))
+        date_entry(toolbar, textvariable=self.den_ngay).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Làm mới", command=self.load_reports).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Quay lại", command=lambda: self.navigator.show("home")).pack(side="right", padx=5)
+        tk.Label(toolbar, textvariable=self.worker.status_var, fg="#e67e22").pack(side="right", padx=5)
+        
+        self.totals_var = tk.StringVar()
+        tk.Label(main_frame, textvariable=self.totals_var, font=("Arial", 12, "bold"), fg="#2c3e50").pack(pady=5)
+        
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill="both", expand=True)
+        self.grids = {}
+        for group, title, key_title in self.TABS:
+            frame = tk.Frame(notebook)
+            notebook.add(frame, text=title)
+            columns = (key_title, "Số đơn", "Tổng tiền", "Đã cọc", "Còn thiếu")
+            tree = ttk.Treeview(frame, columns=columns, show="headings", height=20)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=150)
+            tree.pack(fill="both", expand=True)
+            
+            scrollbar = ttk.Scrollbar(tree, orient="vertical", command=tree.yview)
+            scrollbar.pack(side="right", fill="y")
+            tree.configure(yscrollcommand=scrollbar.set)
+            self.grids[group] = TreeSync(tree)
+    
+    def load_reports(self):
+        try:
+            start = to_iso_date(self.tu_ngay.get())
+            end = to_iso_date(self.den_ngay.get())
+        except ValueError:
+            messagebox.showerror("Lỗi", "Ngày không hợp lệ!")
+            return
+        self.worker.submit(self.fetch_reports, start, end, on_done=self.show_reports)
+    
+    def fetch_reports(self, start, end):
+        reports = {group: self.repo.summary(group) for group, _, _ in self.TABS if group != "ngay"}
+        reports["ngay"] = self.repo.summary("ngay", start, end)
+        return self.repo.totals(), reports
+    
+    def show_reports(self, result):
+        totals, reports = result
+        so_don, tong_tien, da_coc, con_thieu = totals
+        self.totals_var.set(f"Tổng số đơn: {so_don:,.0f}   Tổng tiền: {tong_tien:,.0f}đ   "
+                            f"Đã cọc: {da_coc:,.0f}đ   Còn thiếu: {con_thieu:,.0f}đ")
+        for group, rows in reports.items():
+            self.grids[group].apply([("#" + row[0], self.report_values(group, row)) for row in rows])
+    
+    @staticmethod
+    def report_values(group, row):
+        key, so_don, tong_tien, da_coc, con_thieu = row
+        if group == "ngay":
+            key = to_display_date(key)
+        elif group == "thang" and len(key) == 7:
+            key = f"{key[5:7]}/{key[0:4]}"
+        return (key or "(trống)", f"{so_don:,}", f"{tong_tien:,.0f}đ", f"{da_coc:,.0f}đ", f"{con_thieu:,.0f}đ")
+
+# Cửa sổ riêng (Toplevel) để mở song song với màn hình đang bị chậm; số liệu lấy từ profiler
+class DiagnosticsWindow:
+    REFRESH_MS = 1000
+    COLUMNS = ("Thao tác", "Số lần", "Số dòng", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)")
+    
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Chẩn đoán hiệu năng")
+        self.window.geometry("900x600")
+        
+        toolbar = tk.Frame(self.window)
+        toolbar.pack(fill="x", padx=10, pady=5)
+        self.enabled_var = tk.BooleanVar(value=profiler.enabled)
+        tk.Checkbutton(toolbar, text="Bật đo hiệu năng", variable=self.enabled_var,
+                       command=self.toggle).pack(side="left", padx=5)
+        tk.Label(toolbar, text=f"Ghi lại câu lệnh SQL chậm hơn {profiler.slow_sql_ms:g} ms").pack(side="left", padx=5)
+        tk.Button(toolbar, text="Lưu ra file", command=self.dump).pack(side="right", padx=5)
+        tk.Button(toolbar, text="Xóa số liệu", command=self.reset).pack(side="right", padx=5)
+        
+        tree = ttk.Treeview(self.window, columns=self.COLUMNS, show="headings", height=12)
+        for col in self.COLUMNS:
+            tree.heading(col, text=col)
+            tree.column(col, width=220 if col == "Thao tác" else 90)
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+        self.operations = TreeSync(tree)
+        
+        tk.Label(self.window, text="Câu lệnh SQL chậm (chọn để xem kế hoạch truy vấn):").pack(anchor="w", padx=10)
+        self.slow_tree = ttk.Treeview(self.window, columns=("Thời điểm", "ms", "SQL"), show="headings", height=6)
+        for col, width in (("Thời điểm", 140), ("ms", 80), ("SQL", 620)):
+            self.slow_tree.heading(col, text=col)
+            self.slow_tree.column(col, width=width)
+        self.slow_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        self.slow_tree.bind("<<TreeviewSelect>>", self.show_plan)
+        self.slow_queries = TreeSync(self.slow_tree)
+        self.slow_rows = []
+        
+        self.plan_text = tk.Text(self.window, height=6)
+        self.plan_text.pack(fill="x", padx=10, pady=5)
+        self.refresh()
+    
+    def toggle(self):
+        profiler.enabled = self.enabled_var.get()
+    
+    def reset(self):
+        profiler.reset()
+        self.refresh(schedule=False)
+    
+    def refresh(self, schedule=True):
+        if not self.window.winfo_exists():
+            return
+        stats = profiler.stats()
+        self.operations.apply([(name, (name, op["count"], op["rows"] or "", f"{op['p50_ms']:.1f}",
+                                       f"{op['p95_ms']:.1f}", f"{op['p99_ms']:.1f}", f"{op['max_ms']:.1f}"))
+                               for name, op in stats["operations"].items()])
+        self.slow_rows = stats["slow_queries"][::-1]
+        self.slow_queries.apply([(index, (query["time"], f"{query['ms']:.1f}", query["sql"]))
+                                 for index, query in enumerate(self.slow_rows)])
+        if schedule:
+            self.window.after(self.REFRESH_MS, self.refresh)
+    
+    def show_plan(self, event):
+        selected = self.slow_tree.selection()
+        if not selected:
+            return
+        query = self.slow_rows[int(selected[0])]
+        self.plan_text.delete("1.0", "end")
+        self.plan_text.insert("end", query["sql"] + "\n" + query["params"] + "\n\n" + "\n".join(query["plan"]))
+    
+    def dump(self):
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=".json",
+                                            filetypes=[("JSON files", "*.json")])
+        if not path:
+            return
+        try:
+            profiler.dump(path)
+            messagebox.showinfo("Thành công", f"Đã lưu số liệu ra {path}", parent=self.window)
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(e)}", parent=self.window)
+
+class MaintenanceWindow:
+    COLUMNS = ("Thời điểm", "Kích thước")
+    
+    def __init__(self, root, worker):
+        import maintenance
+        self.maintenance = maintenance
+        self.worker = worker
+        self.database = backend.database
+        self.directory = maintenance.backup_dir(self.database)
+        self.auto_vacuum = None
+        self.window = tk.Toplevel(root)
+        self.window.title("Sao lưu & bảo trì CSDL")
+        self.window.geometry("700x500")
+        
+        self.stats_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.stats_var, justify="left").pack(anchor="w", padx=10, pady=5)
+        
+        toolbar = tk.Frame(self.window)
+        toolbar.pack(fill="x", padx=10, pady=5)
+        tk.Button(toolbar, text="Sao lưu ngay", command=self.snapshot).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Sao lưu ra file...", command=self.backup_to_file).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Thu hồi dung lượng trống", command=self.vacuum).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Tối ưu truy vấn", command=self.optimize).pack(side="left", padx=5)
+        self.progress_var = tk.StringVar()
+        tk.Label(toolbar, textvariable=self.progress_var, fg="#e67e22").pack(side="right", padx=5)
+        
+        tk.Label(self.window, text=f"Các bản sao lưu trong {self.directory}:").pack(anchor="w", padx=10)
+        tree = ttk.Treeview(self.window, columns=self.COLUMNS, show="headings")
+        for col in self.COLUMNS:
+            tree.heading(col, text=col)
+            tree.column(col, width=200)
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+        self.snapshots = TreeSync(tree)
+        self.refresh()
+    
+    def read_state(self):
+        return (self.maintenance.stats(self.database),
+                [(path, taken.strftime("%d/%m/%Y %H:%M:%S"), os.path.getsize(path))
+                 for taken, path in self.maintenance.list_snapshots(self.directory)])
+    
+    def refresh(self):
+        self.worker.submit(self.read_state, on_done=self.show_state, background=True)
+    
+    def show_state(self, state):
+        stats, snapshots = state
+        self.stats_var.set(
+            f"File CSDL: {stats['file_bytes'] / 1024 / 1024:.1f} MB (WAL {stats['wal_bytes'] / 1024 / 1024:.1f} MB)\n"
+            f"Dung lượng trống trong file: {stats['free_bytes'] / 1024 / 1024:.1f} MB ({stats['free_pages']} trang)\n"
+            f"Tự thu hồi dung lượng: {'có' if stats['auto_vacuum'] == 'incremental' else 'không'}")
+        self.auto_vacuum = stats["auto_vacuum"]
+        self.snapshots.apply([(path, (taken, f"{size / 1024 / 1024:.1f} MB")) for path, taken, size in snapshots])
+    
+    def show_progress(self, done, total):
+        self.progress_var.set(f"Đang sao lưu... {done * 100 // max(total, 1)}%")
+    
+    def report_progress(self, done, total):
+        self.worker.call_soon(self.show_progress, done, total)
+    
+    def finish(self, message):
+        self.progress_var.set("")
+        self.refresh()
+        messagebox.showinfo("Thành công", message, parent=self.window)
+    
+    def fail(self, error):
+        self.progress_var.set("")
+        messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(error)}", parent=self.window)
+    
+    def snapshot(self):
+        self.worker.submit(self.maintenance.snapshot, self.database, self.directory,
+                           self.maintenance.KEEP_SNAPSHOTS, self.maintenance.KEEP_DAYS, self.report_progress,
+                           on_done=lambda result: self.finish(f"Đã sao lưu ra {result['path']}"), on_error=self.fail)
+    
+    def backup_to_file(self):
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=".db",
+                                            filetypes=[("SQLite database", "*.db")])
+        if not path:
+            return
+        self.worker.submit(self.maintenance.backup, self.database, path,
+                           self.maintenance.BACKUP_PAGES, self.maintenance.BACKUP_SLEEP_S, self.report_progress,
+                           on_done=lambda result: self.finish(f"Đã sao lưu ra {result['path']}"), on_error=self.fail)
+    
+    def vacuum(self):
+        # CSDL cũ chưa bật auto_vacuum: chuyển đổi một lần bằng VACUUM toàn bộ, các máy khác phải chờ trong lúc chạy
+        if self.auto_vacuum is None:
+            return
+        if self.auto_vacuum != "incremental":
+            if not messagebox.askyesno("Xác nhận", "CSDL chưa bật tự thu hồi dung lượng. Chuyển đổi cần chép lại "
+                                       "toàn bộ file và tạm khóa ghi. Tiếp tục?", parent=self.window):
+                return
+            self.progress_var.set("Đang chuyển đổi...")
+            self.worker.submit(self.maintenance.enable_incremental_vacuum, self.database,
+                               on_done=lambda mode: self.finish("Đã bật tự thu hồi dung lượng"), on_error=self.fail)
+            return
+        self.worker.submit(self.maintenance.incremental_vacuum, self.database,
+                           on_done=lambda pages: self.finish(f"Đã thu hồi {pages} trang trống"), on_error=self.fail)
+    
+    def optimize(self):
+        self.worker.submit(self.maintenance.optimize, self.database, True,
+                           on_done=lambda result: self.finish(f"Đã cập nhật thống kê truy vấn ({result['seconds']} giây)"),
+                           on_error=self.fail)
+
+# In kết quả đo khởi động (JSON) và trả mã lỗi 1 nếu vượt STARTUP_BUDGET_MS hoặc đã nạp sớm thư viện nặng
+def startup_check(window_ms, init_ms):
+    eager_modules = [name for name in LAZY_MODULES if name in sys.modules]
+    ok = window_ms <= STARTUP_BUDGET_MS and not eager_modules
+    print(json.dumps({"window_ms": round(window_ms, 1), "init_db_ms": round(init_ms, 1),
+                      "budget_ms": STARTUP_BUDGET_MS, "eager_modules": eager_modules, "ok": ok}, ensure_ascii=False))
+    return 0 if ok else 1
 
 if __name__ == "__main__":
+    # "main.py maintenance ..." (hoặc bản đóng gói) chạy công cụ sao lưu/bảo trì không mở giao diện; bản đóng gói
+    # không có console nên kết quả được ghi vào backups/baotri.log (xem maintenance.main)
+    if sys.argv[1:2] == ["maintenance"]:
+        from maintenance import main as maintenance_main
+        sys.exit(maintenance_main(sys.argv[2:]))
     root = tk.Tk()
     app = MainApp(root)
-    root.mainloop()
+    # Vẽ cửa sổ chính trước, sau đó mới mở CSDL và kiểm tra lược đồ
+    root.update()
+    window_ms = (time.perf_counter() - STARTED) * 1000
+    try:
+        backend.init()
+    except Exception as e:
+        messagebox.showerror("Lỗi", f"Không thể mở CSDL: {str(e)}")
+    init_ms = (time.perf_counter() - STARTED) * 1000 - window_ms
+    
+    exit_code = startup_check(window_ms, init_ms) if "--startup-check" in sys.argv else None
+    if exit_code is None:
+        root.mainloop()
+    else:
+        root.destroy()
+    app.worker.shutdown()
+    backend.close()
+    if exit_code:
+        sys.exit(exit_code)
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timedelta
+
+from database import DB_PATH, Database
+
+BACKUP_DIR = "backups"
+SNAPSHOT_PREFIX = "quanlybanhang-"
+SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S"
+STATE_FILE = "baotri.json"
+LOG_FILE = "baotri.log"
+
+# Mỗi bước chép BACKUP_PAGES trang rồi nghỉ BACKUP_SLEEP_S để máy khác vẫn đọc/ghi bình thường
+BACKUP_PAGES = 256
+BACKUP_SLEEP_S = 0.005
+VACUUM_STEP_PAGES = 1000
+KEEP_SNAPSHOTS = 10
+KEEP_DAYS = 30
+
+# Chu kỳ (giờ) của các việc bảo trì tự động (run_scheduled)
+SCHEDULE_HOURS = {"snapshot": 24, "vacuum": 6, "analyze": 24 * 7}
+
+AUTO_VACUUM_MODES = ("none", "full", "incremental")
+
+def backup_dir(database):
+    return os.path.join(os.path.dirname(os.path.abspath(database.path)), BACKUP_DIR)
+
+# Sao lưu trực tuyến bằng backup API của SQLite. Ở chế độ WAL kết nối nguồn giữ một giao dịch đọc suốt quá trình nên
+# bản sao là đúng một thời điểm và không bị chép lại từ đầu khi có người ghi (đọc không chặn ghi); với journal DELETE
+# (CSDL trên ổ mạng) giao dịch đọc sẽ chặn ghi nên để backup API tự chép lại khi có thay đổi. Ghi ra file tạm, kiểm
+# tra rồi mới đổi tên nên không bao giờ để lại bản sao dở dang
+def backup(database, target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP_S, progress=None):
+    start = time.perf_counter()
+    temp = target + ".tmp"
+    if os.path.exists(temp):
+        os.remove(temp)
+    source = database.connect()
+    try:
+        if database.journal_mode == "WAL":
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        dest = sqlite3.connect(temp)
+        try:
+            source.backup(dest, pages=pages, sleep=sleep,
+                          progress=(lambda status, remaining, total: progress(total - remaining, total))
+                          if progress else None)
+            check = dest.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            dest.close()
+        if source.in_transaction:
+            source.rollback()
+    finally:
+        source.close()
+    if check != "ok":
+        os.remove(temp)
+        raise sqlite3.DatabaseError(f"Bản sao lưu bị lỗi: {check}")
+    os.replace(temp, target)
+    return {"path": target, "bytes": os.path.getsize(target), "seconds": round(time.perf_counter() - start, 2)}
+
+# [(thời điểm, đường dẫn)] các bản sao lưu trong thư mục, mới nhất trước
+def list_snapshots(directory):
+    snapshots = []
+    if not os.path.isdir(directory):
+        return snapshots
+    for name in os.listdir(directory):
+        if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith(".db")):
+            continue
+        try:
+            taken = datetime.strptime(name[len(SNAPSHOT_PREFIX):-3], SNAPSHOT_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((taken, os.path.join(directory, name)))
+    snapshots.sort(reverse=True)
+    return snapshots
+
+# Giữ keep bản mới nhất và bản mới nhất của mỗi ngày trong keep_days ngày gần đây; xóa phần còn lại
+def rotate(directory, keep=KEEP_SNAPSHOTS, keep_days=KEEP_DAYS, now=None):
+    now = now or datetime.now()
+    snapshots = list_snapshots(directory)
+    kept = {path for _, path in snapshots[:keep]}
+    days = set()
+    for taken, path in snapshots:
+        if now - taken <= timedelta(days=keep_days) and taken.date() not in days:
+            days.add(taken.date())
+            kept.add(path)
+    removed = [path for _, path in snapshots if path not in kept]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def snapshot(database, directory=None, keep=KEEP_SNAPSHOTS, keep_days=KEEP_DAYS, progress=None):
+    directory = directory or backup_dir(database)
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now()
+    result = backup(database, os.path.join(directory, SNAPSHOT_PREFIX + now.strftime(SNAPSHOT_FORMAT) + ".db"),
+                    progress=progress)
+    result["removed"] = rotate(directory, keep, keep_days, now)
+    return result
+
+def stats(database):
+    conn = database.conn
+    page_size, page_count, free_pages, auto_vacuum = (
+        conn.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in ("page_size", "page_count", "freelist_count", "auto_vacuum"))
+    wal_path = database.path + "-wal"
+    return {
+        "path": os.path.abspath(database.path),
+        "file_bytes": os.path.getsize(database.path),
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "page_size": page_size,
+        "page_count": page_count,
+        "free_pages": free_pages,
+        "free_bytes": free_pages * page_size,
+        "auto_vacuum": AUTO_VACUUM_MODES[auto_vacuum],
+    }
+
+# CSDL tạo trước khi bật auto_vacuum (xem PRAGMAS) cần VACUUM toàn bộ một lần; chặn ghi trong lúc chạy
+def enable_incremental_vacuum(database):
+    conn = database.connect()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return AUTO_VACUUM_MODES[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]
+    finally:
+        conn.close()
+
+# sqlite3 chỉ chạy một bước của PRAGMA không trả cột, mà mỗi bước incremental_vacuum trả đúng một trang
+def vacuum_step(database, pages):
+    with database.transaction() as cursor:
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        for _ in range(min(free_pages, pages)):
+            cursor.execute("PRAGMA incremental_vacuum")
+        return free_pages - cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+# Trả trang trống (vd. sau khi xóa sản phẩm có ảnh lớn) về hệ điều hành từng đợt nhỏ; mỗi đợt là một lệnh ghi
+# ngắn qua WriteService nên người dùng không phải chờ. Checkpoint để file thực sự nhỏ lại ở chế độ WAL
+def incremental_vacuum(database, step=VACUUM_STEP_PAGES):
+    if database.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        pages = database.writes.call(vacuum_step, database, step)
+        if not pages:
+            break
+        freed += pages
+    database.conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return freed
+
+def optimize_step(database, analyze):
+    with database.transaction() as cursor:
+        if analyze:
+            cursor.execute("ANALYZE")
+        cursor.execute("PRAGMA optimize").fetchall()
+
+# analyze=True: thống kê lại toàn bộ; không thì PRAGMA optimize chỉ phân tích các bảng cần thiết
+def optimize(database, analyze=False):
+    start = time.perf_counter()
+    database.writes.call(optimize_step, database, analyze)
+    return {"analyze": analyze, "seconds": round(time.perf_counter() - start, 2)}
+
+def vacuum_and_optimize(database, directory=None):
+    return {"freed_pages": incremental_vacuum(database), "optimize": optimize(database)}
+
+TASKS = {
+    "snapshot": lambda database, directory: snapshot(database, directory),
+    "vacuum": vacuum_and_optimize,
+    "analyze": lambda database, directory: optimize(database, analyze=True),
+}
+
+def load_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(directory, state):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+# Chạy các việc đã đến hạn theo SCHEDULE_HOURS (force: chạy tất cả); thời điểm chạy lưu trong baotri.json
+def run_scheduled(database, directory=None, now=None, force=False):
+    directory = directory or backup_dir(database)
+    now = now or datetime.now()
+    state = load_state(directory)
+    done = {}
+    for task, hours in SCHEDULE_HOURS.items():
+        last = state.get(task)
+        if not force and last and now - datetime.fromisoformat(last) < timedelta(hours=hours):
+            continue
+        done[task] = TASKS[task](database, directory)
+        state[task] = now.isoformat(timespec="seconds")
+        save_state(directory, state)
+    return done
+
+# Bản đóng gói (main.spec: console=False) không có stdout/stderr: kết quả, lỗi và hướng dẫn dùng của argparse được
+# ghi thêm vào backups/baotri.log cạnh file CSDL mặc định
+def main(argv=None):
+    if sys.stdout is not None and sys.stderr is not None:
+        return run_cli(argv)
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), BACKUP_DIR)
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, LOG_FILE), "a", encoding="utf-8") as log:
+        args = sys.argv[1:] if argv is None else argv
+        log.write(f"--- {datetime.now().isoformat(timespec='seconds')} {' '.join(args)}\n")
+        with redirect_stdout(log), redirect_stderr(log):
+            return run_cli(argv)
+
+def run_cli(argv=None):
+    parser = argparse.ArgumentParser(prog="maintenance", description="Sao lưu và bảo trì quanlybanhang.db")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", help=f"thư mục sao lưu (mặc định: {BACKUP_DIR}/ cạnh file CSDL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("backup", help="sao lưu ra một file")
+    command.add_argument("target")
+    command = commands.add_parser("snapshot", help="sao lưu vào thư mục sao lưu và xoay vòng các bản cũ")
+    command.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    command.add_argument("--keep-days", type=int, default=KEEP_DAYS)
+    commands.add_parser("vacuum", help="trả dung lượng trống về hệ điều hành (incremental_vacuum)")
+    commands.add_parser("enable-incremental", help="bật auto_vacuum=INCREMENTAL cho CSDL cũ (VACUUM toàn bộ)")
+    command = commands.add_parser("optimize", help="PRAGMA optimize")
+    command.add_argument("--analyze", action="store_true", help="chạy ANALYZE toàn bộ trước")
+    commands.add_parser("stats", help="kích thước file, số trang trống")
+    command = commands.add_parser("run", help="chạy các việc bảo trì đã đến hạn")
+    command.add_argument("--all", action="store_true", help="chạy tất cả, kể cả chưa đến hạn")
+    args = parser.parse_args(argv)
+
+    database = Database(args.db)
+    directory = args.dir or backup_dir(database)
+    try:
+        if args.command == "backup":
+            result = backup(database, os.path.abspath(args.target))
+        elif args.command == "snapshot":
+            result = snapshot(database, directory, args.keep, args.keep_days)
+        elif args.command == "vacuum":
+            result = {"freed_pages": incremental_vacuum(database), "stats": stats(database)}
+        elif args.command == "enable-incremental":
+            result = {"auto_vacuum": enable_incremental_vacuum(database), "stats": stats(database)}
+        elif args.command == "optimize":
+            result = optimize(database, args.analyze)
+        elif args.command == "stats":
+            result = stats(database)
+        else:
+            result = run_scheduled(database, directory, force=args.all)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import sys
+from operator import attrgetter
+
+from database import OrderRepository, ProductRepository, to_display_date
+
+def money(value):
+    return f"{value:,.0f}đ"
+
+# Cột ít giá trị khác nhau (trạng thái, danh mục, ngày): sqlite3 tạo chuỗi mới cho mỗi dòng, dùng chung một bản
+def shared(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+# Dòng của lưới chỉ giữ giá trị gốc trong __slots__ (không có __dict__); chuỗi hiển thị (tiền, ngày) chỉ được
+# tạo bởi values() khi dòng được chèn hoặc sửa trong Treeview (TreeSync) và không được giữ lại
+class Row:
+    __slots__ = ()
+    __hash__ = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls(*row) for row in rows]
+
+    # chunks: các đợt dòng từ fetchmany (Database.query_chunks); mỗi đợt tuple được bỏ ngay sau khi chuyển
+    @classmethod
+    def from_chunks(cls, chunks):
+        result = []
+        for rows in chunks:
+            result.extend(cls(*row) for row in rows)
+        return result
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.fields(self) == self.fields(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return f"{type(self).__name__}{self.fields(self)!r}"
+
+class ProductRow(Row):
+    __slots__ = ProductRepository.COLUMNS
+    fields = attrgetter(*__slots__)
+
+    def __init__(self, id, ma_sp, ten_sp, anh_hash, gia_nhap, gia_ban, so_luong, anh_nho_hash=None):
+        self.id = id
+        self.ma_sp = ma_sp
+        self.ten_sp = ten_sp
+        self.anh_hash = anh_hash
+        self.gia_nhap = gia_nhap
+        self.gia_ban = gia_ban
+        self.so_luong = so_luong
+        self.anh_nho_hash = anh_nho_hash
+
+    def values(self):
+        return (
+            self.id, self.ma_sp, self.ten_sp,
+            "Nhấn đúp 2 lần để xem hình ảnh" if self.anh_hash else "Không có ảnh",
+            money(self.gia_nhap),
+            money(self.gia_ban),
+            self.so_luong
+        )
+
+class OrderRow(Row):
+    __slots__ = OrderRepository.COLUMNS
+    fields = attrgetter(*__slots__)
+
+    def __init__(self, id, ten_kh, danh_muc, ngay_dat, ngay_giao, file_sp, tong_tien, da_coc, con_thieu, trang_thai):
+        self.id = id
+        self.ten_kh = ten_kh
+        self.danh_muc = shared(danh_muc)
+        self.ngay_dat = shared(ngay_dat)
+        self.ngay_giao = shared(ngay_giao)
+        self.file_sp = file_sp
+        self.tong_tien = tong_tien
+        self.da_coc = da_coc
+        self.con_thieu = con_thieu
+        self.trang_thai = shared(trang_thai)
+
+    def values(self):
+        return (
+            self.id, self.ten_kh, self.danh_muc, to_display_date(self.ngay_dat), to_display_date(self.ngay_giao),
+            self.file_sp, money(self.tong_tien), money(self.da_coc), money(self.con_thieu), self.trang_thai
+        )
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Bật bằng biến môi trường QLBH_PROFILE=1 hoặc ô "Bật đo hiệu năng" trong cửa sổ chẩn đoán
+ENABLED = os.environ.get("QLBH_PROFILE", "") not in ("", "0")
+SLOW_SQL_MS = float(os.environ.get("QLBH_SLOW_SQL_MS", "50"))
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+# Số dòng của kết quả repository: danh sách dòng, hoặc (dòng, còn_nữa) của KeysetPager
+def row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    return None
+
+class Profiler:
+    MAX_SAMPLES = 1000
+    MAX_SLOW_QUERIES = 200
+
+    def __init__(self, enabled=ENABLED, slow_sql_ms=SLOW_SQL_MS):
+        self.enabled = enabled
+        self.slow_sql_ms = slow_sql_ms
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.slow_queries = deque(maxlen=self.MAX_SLOW_QUERIES)
+
+    def record(self, name, ms, rows=None):
+        with self.lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = {"count": 0, "rows": 0, "total_ms": 0.0,
+                                                 "samples": deque(maxlen=self.MAX_SAMPLES)}
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["samples"].append(ms)
+            if rows is not None:
+                stats["rows"] += rows
+
+    @contextmanager
+    def measure(self, name, rows=None):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, rows)
+
+    # Bọc hàm chạy trên luồng nền; bật/tắt có hiệu lực ngay cả với hàm đã bọc từ trước
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.record(name, (time.perf_counter() - start) * 1000, row_count(result))
+            return result
+        return timed
+
+    def record_sql(self, connection, sql, params, ms):
+        self.record("sql", ms)
+        if ms < self.slow_sql_ms:
+            return
+        plan = []
+        if params is not None and sql.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT"):
+            try:
+                # Cursor gốc của sqlite3 để lệnh EXPLAIN không bị đo lại
+                plan = [row[3] for row in sqlite3.Cursor(connection).execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except sqlite3.Error as e:
+                plan = [f"Không lấy được kế hoạch: {e}"]
+        with self.lock:
+            self.slow_queries.append({
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "ms": round(ms, 3),
+                "sql": " ".join(sql.split()),
+                "params": repr(params)[:200],
+                "plan": plan,
+            })
+
+    # Mỗi thao tác: số lần, tổng số dòng, p50/p95/p99/max (ms) trên MAX_SAMPLES lần gần nhất
+    def stats(self):
+        with self.lock:
+            operations = {name: (stats["count"], stats["rows"], stats["total_ms"], sorted(stats["samples"]))
+                          for name, stats in self.operations.items()}
+            slow_queries = list(self.slow_queries)
+        return {
+            "operations": {name: {
+                "count": count,
+                "rows": rows,
+                "total_ms": round(total_ms, 3),
+                "p50_ms": round(percentile(samples, 0.50), 3),
+                "p95_ms": round(percentile(samples, 0.95), 3),
+                "p99_ms": round(percentile(samples, 0.99), 3),
+                "max_ms": round(samples[-1], 3) if samples else 0.0,
+            } for name, (count, rows, total_ms, samples) in sorted(operations.items())},
+            "slow_queries": slow_queries,
+        }
+
+    def dump(self, path):
+        data = self.stats()
+        data["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        data["slow_sql_ms"] = self.slow_sql_ms
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+profiler = Profiler()
+
+# Kết nối của Database dùng các lớp này; khi profiler tắt mỗi lệnh chỉ tốn thêm một phép kiểm tra
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        if not profiler.enabled:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        cursor = super().execute(sql, params)
+        profiler.record_sql(self.connection, sql, params, (time.perf_counter() - start) * 1000)
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        if not profiler.enabled:
+            return super().executemany(sql, seq_of_params)
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_params)
+        profiler.record_sql(self.connection, sql, None, (time.perf_counter() - start) * 1000)
+        return cursor
+
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # Connection.execute của sqlite3 không gọi lại cursor() nên phải ghi đè để đi qua ProfiledCursor
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import dumps, loads
+from database import (DB_PATH, Database, ProductRepository, OrderRepository, ReportRepository, ChangeLog,
+                      DatabaseBusyError, OutOfStockError, init_db)
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_HEADER_LINES = 100
+
+# Chỉ các phương thức trong danh sách mới được gọi qua API
+READ_METHODS = {
+    "products": {"page", "search", "get", "get_many", "get_by_code", "get_image_hash", "get_image"},
+    "orders": {"list", "search", "get", "get_many", "get_items", "due_between"},
+    "reports": {"summary", "totals"},
+    "changes": {"version", "since"},
+    "analytics": {"inventory_report"},
+}
+WRITE_METHODS = {
+    "products": {"insert", "update", "delete", "delete_many", "adjust_prices", "adjust_quantities"},
+    "orders": {"insert", "update", "set_status", "set_status_many", "delete", "delete_many"},
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 413: "Payload Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def error_status(e):
+    if isinstance(e, ApiError):
+        return e.status
+    if isinstance(e, (sqlite3.IntegrityError, OutOfStockError)):
+        return 409
+    if isinstance(e, DatabaseBusyError):
+        return 503
+    if isinstance(e, (ValueError, TypeError)):
+        return 400
+    return 500
+
+# Nhiều luồng đọc song song (WAL); lệnh ghi được gửi thẳng vào WriteService của CSDL (một luồng ghi, gom các
+# yêu cầu đến cùng lúc vào một lần commit) nên không chiếm luồng đọc trong lúc chờ
+class Api:
+    def __init__(self, path=DB_PATH, readers=4):
+        self.database = Database(path)
+        self.repos = {
+            "products": ProductRepository(self.database),
+            "orders": OrderRepository(self.database),
+            "reports": ReportRepository(self.database),
+            "changes": ChangeLog(self.database),
+        }
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="api-read")
+
+    def init(self):
+        init_db(self.database)
+
+    def is_write(self, resource, method):
+        if method in WRITE_METHODS.get(resource, ()):
+            return True
+        if method in READ_METHODS.get(resource, ()):
+            return False
+        raise ApiError(404, f"Không có API {resource}/{method}")
+
+    def invoke(self, resource, method, args):
+        if resource == "analytics":
+            from analytics import inventory_report
+            return inventory_report(self.database, *args)
+        repo = self.repos[resource]
+        if resource == "products" and method == "page":
+            spec, anchor, forward = args
+            if isinstance(anchor, list):
+                anchor = tuple(anchor)
+            return repo.pager(*spec)._fetch(anchor, forward)
+        return getattr(repo, method)(*args)
+
+    async def call(self, resource, method, args):
+        if self.is_write(resource, method):
+            return await asyncio.wrap_future(self.database.writes.submit(self.invoke, resource, method, args))
+        return await asyncio.get_running_loop().run_in_executor(self.readers, self.invoke, resource, method, args)
+
+    def close(self):
+        self.readers.shutdown(wait=True)
+        self.database.close()
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ApiError(400, "Dòng yêu cầu không hợp lệ")
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise ApiError(400, "Quá nhiều dòng tiêu đề")
+    length = headers.get("content-length", "") or "0"
+    if not length.isascii() or not length.isdigit():
+        raise ApiError(400, "Content-Length không hợp lệ")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise ApiError(413, "Dữ liệu gửi lên quá lớn")
+    body = await reader.readexactly(length) if length else b""
+    keep_alive = headers.get("connection", "").lower() != "close"
+    return method, target, body, keep_alive
+
+def write_response(writer, status, payload, keep_alive):
+    body = dumps(payload)
+    writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                  "Content-Type: application/json; charset=utf-8\r\n"
+                  f"Content-Length: {len(body)}\r\n"
+                  f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + body)
+
+async def dispatch(api, method, target, body):
+    path = target.split("?", 1)[0].strip("/").split("/")
+    if method == "GET" and path == ["api", "health"]:
+        return {"result": "ok"}
+    if method != "POST" or len(path) != 3 or path[0] != "api":
+        raise ApiError(404, f"Không có đường dẫn {target}")
+    args = loads(body).get("args", []) if body else []
+    return {"result": await api.call(path[1], path[2], args)}
+
+async def handle_client(api, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except ApiError as e:
+                write_response(writer, e.status, {"error": {"type": "ApiError", "message": str(e)}}, False)
+                break
+            if request is None:
+                break
+            method, target, body, keep_alive = request
+            try:
+                status, payload = 200, await dispatch(api, method, target, body)
+            except Exception as e:
+                status, payload = error_status(e), {"error": {"type": type(e).__name__, "message": str(e)}}
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, path, readers):
+    api = Api(path, readers)
+    api.init()
+    server = await asyncio.start_server(lambda r, w: handle_client(api, r, w), host, port)
+    print(f"Máy chủ quản lý bán hàng: http://{host}:{port} (CSDL {path})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Máy chủ HTTP/JSON cho nhiều máy cùng dùng quanlybanhang.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, args.readers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
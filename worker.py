@@ -0,0 +1,85 @@
+import queue
+import tkinter as tk
+from tkinter import messagebox
+from concurrent.futures import ThreadPoolExecutor
+
+# Chạy truy vấn CSDL và xử lý ảnh trên luồng nền; kết quả được trả về luồng Tk bằng root.after
+class BackgroundWorker:
+    POLL_MS = 30
+
+    def __init__(self, root, max_workers=2):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qlbh-worker")
+        self.results = queue.Queue()
+        self.calls = queue.Queue()
+        self.pending = 0
+        self.busy = 0
+        self.polling = False
+        self.status_var = tk.StringVar(master=root, value="")
+
+    # background=True dùng cho việc nạp trước (prefetch), không bật chỉ báo bận
+    def submit(self, fn, *args, on_done=None, on_error=None, background=False):
+        self.pending += 1
+        if not background:
+            self.busy += 1
+            self.set_busy(True)
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self.results.put((f, on_done, on_error, background)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_MS, self.poll)
+        return future
+
+    # Gọi từ luồng nền: fn(*args) sẽ chạy trên luồng Tk ở lần poll kế tiếp (vd. cập nhật tiến độ)
+    def call_soon(self, fn, *args):
+        self.calls.put((fn, args))
+
+    def poll(self):
+        while True:
+            try:
+                fn, args = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except tk.TclError:
+                pass
+
+        while True:
+            try:
+                future, on_done, on_error, background = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if not background:
+                self.busy -= 1
+                if not self.busy:
+                    self.set_busy(False)
+            error = future.exception()
+            try:
+                if error is not None:
+                    (on_error or self.show_error)(error)
+                elif on_done is not None:
+                    on_done(future.result())
+            except tk.TclError:
+                # Màn hình gửi yêu cầu đã bị đóng trước khi có kết quả
+                pass
+
+        if self.pending:
+            self.root.after(self.POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def set_busy(self, busy):
+        self.status_var.set("Đang xử lý..." if busy else "")
+        try:
+            self.root.config(cursor="watch" if busy else "")
+        except tk.TclError:
+            pass
+
+    @staticmethod
+    def show_error(error):
+        messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {str(error)}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)